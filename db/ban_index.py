@@ -0,0 +1,83 @@
+﻿import time
+from datetime import datetime, timezone
+
+# Format of Users.BanEnd, the same as SQLite's datetime(): UTC, second precision.
+BAN_END_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_ban_end(ban_end: str | None) -> float | None:
+    """Unix timestamp of a BanEnd value; None for permanent bans and values that cannot be parsed."""
+    if not ban_end:
+        return None
+    try:
+        parsed = datetime.fromisoformat(ban_end)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def format_ban_end(timestamp: float) -> str:
+    """BanEnd value for a Unix timestamp."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(BAN_END_FORMAT)
+
+
+def normalize_ban_end(ban_end: str | None) -> str | None:
+    """BanEnd in BAN_END_FORMAT, so SQL can compare it as text; values that cannot be parsed are kept."""
+    end = parse_ban_end(ban_end)
+    return ban_end if end is None else format_ban_end(end)
+
+
+def ban_expired(ban_end: str | None, now: float | None = None) -> bool:
+    """Whether a ban ending at ban_end is over; permanent bans never are."""
+    end = parse_ban_end(ban_end)
+    return end is not None and end <= (time.time() if now is None else now)
+
+
+class BanIndex:
+    """In-memory set of banned users and the BanEnd of their bans.
+
+    Loaded from Users at startup and kept in step by Database's ban operations, so checking whether a
+    user is banned costs no I/O. A ban counts as lifted as soon as its end has passed, even before the
+    ban scheduler has cleared it in the database.
+    """
+
+    def __init__(self):
+        """Create an empty index; load() fills it."""
+        self.loaded = False
+        self._bans: dict[int, tuple[float | None, str | None]] = {}
+
+    def __len__(self) -> int:
+        return len(self._bans)
+
+    def load(self, rows: list[tuple[int, str | None]]) -> None:
+        """Replace the index with (UserId, BanEnd) rows of banned users."""
+        self._bans = {user_id: (parse_ban_end(ban_end), ban_end) for user_id, ban_end in rows}
+        self.loaded = True
+
+    def ban(self, user_id: int, ban_end: str | None) -> None:
+        """Record that a user is banned until ban_end, or permanently without it."""
+        self._bans[user_id] = (parse_ban_end(ban_end), ban_end)
+
+    def unban(self, user_id: int) -> None:
+        """Record that a user is not banned."""
+        self._bans.pop(user_id, None)
+
+    def status(self, user_id: int, now: float | None = None) -> tuple[bool, str | None]:
+        """Whether a user is banned and the BanEnd of the ban."""
+        entry = self._bans.get(user_id)
+        if entry is None:
+            return False, None
+        end, ban_end = entry
+        if end is not None and end <= (time.time() if now is None else now):
+            return False, None
+        return True, ban_end
+
+    def expired(self, now: float | None = None) -> list[int]:
+        """Users whose ban has ended but is still to be lifted."""
+        now = time.time() if now is None else now
+        return [user_id for user_id, (end, _) in self._bans.items() if end is not None and end <= now]
+
+
+ban_index = BanIndex()
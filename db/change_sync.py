@@ -0,0 +1,65 @@
+﻿import asyncio
+from os import getenv
+from typing import Callable
+
+from db.database import Database
+from utils.logging import logger
+
+USER_CHANGES_SYNC_INTERVAL = float(getenv("DB_USER_CHANGES_SYNC_INTERVAL", "2"))
+
+ChangeListener = Callable[[list[int]], None]
+
+
+class UserChangesSync:
+    """Keeps this process's caches consistent with changes made by other bot processes.
+
+    Every write that makes cached user data stale is recorded in the UserChanges table; this task polls
+    it, which invalidates the affected cached rows and re-reads their bans into the ban index, and passes
+    the changed user IDs to the subscribed listeners so they can drop caches of their own.
+    """
+
+    def __init__(self, interval: float = USER_CHANGES_SYNC_INTERVAL):
+        """Create a stopped task polling every interval seconds; 0 disables it."""
+        self.interval = interval
+        self._listeners: list[ChangeListener] = []
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the polling task is alive."""
+        return self._task is not None and not self._task.done()
+
+    def subscribe(self, listener: ChangeListener) -> None:
+        """Call listener with the IDs of the users changed since the previous poll."""
+        self._listeners.append(listener)
+
+    def start(self) -> None:
+        """Start polling UserChanges."""
+        if self.interval > 0 and not self.is_running:
+            self._task = asyncio.create_task(self._run(), name="user-changes-sync")
+
+    async def stop(self) -> None:
+        """Stop polling."""
+        if self.is_running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self) -> None:
+        """Apply the user changes made since the previous poll."""
+        db = Database()
+        while True:
+            try:
+                user_ids = await db.sync_user_changes()
+                if user_ids:
+                    for listener in self._listeners:
+                        listener(user_ids)
+            except Exception as e:
+                logger.error(f"Could not sync user changes: {e}")
+            await asyncio.sleep(self.interval)
+
+
+user_changes_sync = UserChangesSync()
@@ -1,15 +1,36 @@
-﻿from os import getenv
+﻿import json
+import time
+from os import getenv
+from typing import AsyncIterator
 from dotenv import load_dotenv
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Optional
 
 import aiosqlite
 
+from db.ban_index import ban_expired, ban_index, format_ban_end, normalize_ban_end
+from db.pool import ConnectionPool
+from db.rank_index import rank_index
+from db.records import USER_COLUMNS, Broadcast, PendingGame, UserRecord, user_record_factory
+from db.user_cache import MISSING, user_cache
+from db.writer import WriteQueue
+from game.stats import calculate_success
 from utils.logging import logger
 
 env_path = Path(__file__).parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
+USER_FIELDS = {field: column for column, field in USER_COLUMNS.items()}
+
+_pool: ConnectionPool | None = None
+_writer: WriteQueue | None = None
+_last_change_id: int | None = None
+
+USER_CHANGES_RETENTION = float(getenv("DB_USER_CHANGES_RETENTION", "3600"))
+ITER_BATCH_SIZE = int(getenv("DB_ITER_BATCH_SIZE", "500"))
+BULK_UPDATE_CHUNK_SIZE = int(getenv("DB_BULK_UPDATE_CHUNK_SIZE", "1000"))
+
+
 class Database:
     """Handles all database operations for the application."""
     
@@ -18,11 +39,164 @@ class Database:
         self.db_path = getenv("DB_PATH")
         if not self.db_path:
             logger.critical("DB_PATH environment variable not set.")
+
+    @property
+    def pool(self) -> ConnectionPool:
+        """Connection pool shared by every Database instance in the process."""
+        global _pool
+        if _pool is None:
+            _pool = ConnectionPool(self.db_path)
+        return _pool
+
+    @property
+    def writer(self) -> WriteQueue:
+        """Group-commit write queue shared by every Database instance in the process."""
+        global _writer
+        if _writer is None:
+            _writer = WriteQueue(self.db_path)
+        return _writer
+
+    async def open(self, load_rank_index: bool = True) -> None:
+        """Open the shared connection pool and start the writer; called once at startup.
+
+        Without load_rank_index, leaderboard queries use SQL, which stays correct when other processes
+        write to the database too, and the rank index is left empty: writes do not update it either.
+        """
+        await self.pool.open()
+        await self.writer.start()
+        await self.load_ban_index()
+        if load_rank_index:
+            await self.load_rank_index()
+
+    async def close(self) -> None:
+        """Flush pending writes and close the shared connections; called once on shutdown."""
+        await self.writer.stop()
+        await self.pool.close()
+
+    @staticmethod
+    def cache_stats() -> dict:
+        """Hit/miss counters and size of the user row cache."""
+        return user_cache.stats()
+
+    async def _execute_write(self, query: str, params: tuple = ()) -> int:
+        """Queue a single write statement and return the number of affected rows once committed."""
+        async def op(conn: aiosqlite.Connection) -> int:
+            cursor = await conn.execute(query, params)
+            rowcount = cursor.rowcount
+            await cursor.close()
+            return rowcount
+
+        return await self.writer.submit(op)
+
+    @staticmethod
+    async def _fetch_user(conn: aiosqlite.Connection, user_id: int) -> UserRecord | None:
+        """Read a user's row as a UserRecord on the given connection."""
+        cursor = await conn.execute("SELECT * FROM Users WHERE UserId = ?", (user_id,))
+        cursor.row_factory = user_record_factory
+        user = await cursor.fetchone()
+        await cursor.close()
+        return user
+
+    async def _refresh_success(self, conn: aiosqlite.Connection, user_id: int) -> int | None:
+        """Recalculate a user's success and upsert it into LeaderboardUsers on the given connection.
+
+        Runs inside the caller's write transaction so the leaderboard row never lags behind Users.
+        """
+        user = await self._fetch_user(conn, user_id)
+        if user is None:
+            return None
+        success = calculate_success(user)
+        await conn.execute("INSERT INTO LeaderboardUsers (UserId, Success) VALUES (?, ?) "
+                           "ON CONFLICT(UserId) DO UPDATE SET Success = excluded.Success", (user_id, success))
+        return success
+
+    @staticmethod
+    async def _notify_change(conn: aiosqlite.Connection, user_id: int) -> None:
+        """Record in UserChanges that a user's cached data is stale, for the other bot processes."""
+        await conn.execute("INSERT INTO UserChanges (UserId, ChangedAt) VALUES (?, ?)", (user_id, time.time()))
+
+    async def sync_user_changes(self) -> list[int]:
+        """Invalidate the cached rows of users changed by any process since the last call.
+
+        The first call only remembers where UserChanges ends. Rows older than DB_USER_CHANGES_RETENTION
+        seconds are pruned along the way.
+
+        Returns:
+            list[int]: The IDs of the changed users, for callers holding caches of their own.
+        """
+        global _last_change_id
+        if _last_change_id is None:
+            row = await self._execute_query("SELECT COALESCE(MAX(Id), 0) FROM UserChanges", fetchone=True)
+            if row is not None:
+                _last_change_id = row[0]
+            return []
+        rows = await self._execute_query("SELECT Id, UserId FROM UserChanges WHERE Id > ? ORDER BY Id",
+                                         (_last_change_id,), fetchall=True)
+        if not rows:
+            return []
+        _last_change_id = rows[-1][0]
+        user_ids = list(dict.fromkeys(row[1] for row in rows))
+        for user_id in user_ids:
+            user_cache.invalidate(user_id)
+        if ban_index.loaded:
+            await self._refresh_bans(user_ids)
+        try:
+            await self._execute_write("DELETE FROM UserChanges WHERE ChangedAt < ?",
+                                      (time.time() - USER_CHANGES_RETENTION,))
+        except Exception as e:
+            logger.error(f"Error pruning UserChanges: {e}")
+        return user_ids
+
+    async def load_ban_index(self) -> None:
+        """Load the in-memory ban index from the banned Users rows, rewriting BanEnd values stored in another
+        format than BAN_END_FORMAT first."""
+        rows = await self._execute_query("SELECT UserId, BanEnd FROM Users WHERE IsBanned = 'true'", fetchall=True)
+        if rows is None:
+            logger.error("Could not load the ban index, ban checks will use SQL.")
+            return
+        rows = [(user_id, ban_end, normalize_ban_end(ban_end)) for user_id, ban_end in rows]
+        changed = [(normalized, user_id) for user_id, ban_end, normalized in rows if normalized != ban_end]
+        if changed:
+            async def op(conn: aiosqlite.Connection) -> None:
+                await conn.executemany("UPDATE Users SET BanEnd = ? WHERE UserId = ?", changed)
+
+            try:
+                await self.writer.submit(op)
+                logger.info(f"Normalized the BanEnd of {len(changed)} users.")
+            except Exception as e:
+                logger.error(f"Error normalizing BanEnd values: {e}")
+        ban_index.load([(user_id, normalized) for user_id, _, normalized in rows])
+        logger.info(f"Loaded ban index with {len(ban_index)} banned users.")
+
+    async def _refresh_bans(self, user_ids: list[int]) -> None:
+        """Re-read the ban status of users changed by other processes into the ban index."""
+        for start in range(0, len(user_ids), ITER_BATCH_SIZE):
+            chunk = user_ids[start:start + ITER_BATCH_SIZE]
+            rows = await self._execute_query(
+                f"SELECT UserId, BanEnd FROM Users WHERE IsBanned = 'true' AND UserId IN ({', '.join('?' * len(chunk))})",
+                tuple(chunk), fetchall=True)
+            if rows is None:
+                continue
+            banned = dict(rows)
+            for user_id in chunk:
+                if user_id in banned:
+                    ban_index.ban(user_id, banned[user_id])
+                else:
+                    ban_index.unban(user_id)
+
+    async def load_rank_index(self) -> None:
+        """Load the in-memory rank index from LeaderboardUsers."""
+        rows = await self._execute_query("SELECT UserId, Success FROM LeaderboardUsers", fetchall=True)
+        if rows is None:
+            logger.error("Could not load the rank index, leaderboard queries will use SQL.")
+            return
+        rank_index.load(rows)
+        logger.info(f"Loaded rank index with {len(rank_index)} users.")
     
     async def _execute_query(self, query: str, params: tuple = (), fetchone: bool = False, fetchall: bool = False):
         """Execute a query with optional parameters, returning results if specified."""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.pool.acquire() as db:
                 cursor = await db.execute(query, params)
                 if fetchone:
                     result = await cursor.fetchone()
@@ -36,10 +210,20 @@ class Database:
             logger.error(f"Error executing query '{query}': {e}")
             return None
 
-    async def get_user(self, user_id: int) -> Optional[Tuple] | None:
-        """Retrieve user data from the database by user ID."""
+    async def get_user(self, user_id: int) -> Optional[UserRecord] | None:
+        """Retrieve user data by user ID, serving it from the user cache when possible."""
+        user = user_cache.get(user_id)
+        if user is not MISSING:
+            return user
         logger.debug(f"Executing query to get user {user_id}.")
-        user = await self._execute_query("SELECT * FROM Users WHERE UserId = ?", (user_id,), fetchone=True)
+        generation = user_cache.generation
+        try:
+            async with self.pool.acquire() as db:
+                user = await self._fetch_user(db, user_id)
+        except Exception as e:
+            logger.error(f"Error getting user {user_id}: {e}")
+            return None
+        user_cache.put(user_id, user, generation)
         if user:
             logger.debug(f"User {user_id} found in database.")
             return user
@@ -49,6 +233,8 @@ class Database:
 
     async def get_user_position(self, user_id: int) -> Optional[int] | None:
         """Retrieve user's position in the leaderboard based on success score."""
+        if rank_index.loaded:
+            return rank_index.rank(user_id)
         logger.debug(f"Executing query to get position for user {user_id}.")
         position = await self._execute_query("SELECT COUNT(*) + 1 FROM LeaderboardUsers WHERE Success > "
                                              "(SELECT Success FROM LeaderboardUsers WHERE UserId = ?)",
@@ -59,74 +245,366 @@ class Database:
         else:
             logger.debug(f"No position found for user {user_id}.")
             return None
-    async def is_banned(self, user_id: int) -> bool:
-        """Check if a user is banned by querying the IsBanned field."""
-        logger.debug(f"Executing query to check ban status for user {user_id}.")
-        result = await self._execute_query("SELECT IsBanned FROM Users WHERE UserId = ?", (user_id,),
-                                           fetchone=True)
+
+    async def _get_columns(self, user_id: int, columns: tuple[str, ...]) -> tuple | None:
+        """Read a few columns of a user, from the cached row if present or with a narrow projection query.
+
+        columns are UserRecord field names; the result tuple follows their order.
+        """
+        user = user_cache.get(user_id)
+        if user is not MISSING:
+            return tuple(getattr(user, column) for column in columns) if user else None
+        names = ", ".join(USER_FIELDS[column] for column in columns)
+        return await self._execute_query(f"SELECT {names} FROM Users WHERE UserId = ?", (user_id,), fetchone=True)
+
+    async def get_ban_status(self, user_id: int) -> tuple[bool, Optional[str]] | None:
+        """Retrieve whether a user is banned and when the ban ends, from the ban index once it is loaded.
+
+        Bans whose BanEnd has passed count as lifted.
+        """
+        logger.debug(f"Getting ban status for user {user_id}.")
+        if ban_index.loaded:
+            return ban_index.status(user_id)
+        result = await self._get_columns(user_id, ("is_banned", "ban_end"))
         if result:
-            logger.debug(f"Ban status for user {user_id}: {result[0] == 1}.")
-            return result[0] == 1
+            banned = result[0] == 'true' and not ban_expired(result[1])
+            logger.debug(f"Ban status for user {user_id}: {banned}, until {result[1]}.")
+            return banned, result[1] if banned else None
         else:
             logger.debug(f"No ban data found for user {user_id}.")
-            return False
+            return None
+
+    async def is_banned(self, user_id: int) -> bool:
+        """Check if a user is banned."""
+        status = await self.get_ban_status(user_id)
+        return status[0] if status else False
     
     async def get_ban_date(self, user_id: int) -> Optional[str] | None:
         """Retrieve the ban end date for a user."""
-        logger.debug(f"Executing query to get ban date for user {user_id}.")
-        result = await self._execute_query("SELECT BanEnd FROM Users WHERE UserId = ?", (user_id,),
-                                           fetchone=True)
-        if result:
-            logger.debug(f"Ban date for user {user_id}: {result[0]}.")
-            return result[0]
-        else:
-            logger.debug(f"No ban date found for user {user_id}.")
-            return None
+        status = await self.get_ban_status(user_id)
+        return status[1] if status else None
+
+    async def get_user_lang(self, user_id: int) -> Optional[str] | None:
+        """Retrieve the language code of a user."""
+        result = await self._get_columns(user_id, ("lang",))
+        return result[0] if result else None
 
     async def create_user(self, user_id: int, username: str, lang: str) -> None:
         """Create a new user in the database with the provided details."""
         logger.debug(f"Creating new user {user_id} with lang {lang}.")
+        async def op(conn: aiosqlite.Connection) -> None:
+            await conn.execute("""
+                INSERT INTO Users (UserId, Username, Lang, RegisterDate)
+                VALUES (?, ?, ?, datetime('now'))
+            """, (user_id, username, lang))
+            await self._notify_change(conn, user_id)
+            return await self._refresh_success(conn, user_id)
+
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("""
-                    INSERT INTO Users (UserId, Username, Lang, RegisterDate)
-                    VALUES (?, ?, ?, datetime('now'))
-                """, (user_id, username, lang))
-                await db.commit()
-                logger.info(f"User {user_id} created successfully.")
+            success = await self.writer.submit(op)
+            if rank_index.loaded:
+                rank_index.update(user_id, success)
+            logger.info(f"User {user_id} created successfully.")
         except Exception as e:
             logger.error(f"Error creating user {user_id}: {e}")
+        finally:
+            user_cache.invalidate(user_id)
 
     async def update_user_lang(self, user_id: int, lang: str) -> None:
         """Update the language for a user."""
         logger.debug(f"Updating language for user {user_id} to {lang}.")
+        async def op(conn: aiosqlite.Connection) -> None:
+            await conn.execute("UPDATE users SET Lang = ? WHERE UserId = ?", (lang, user_id))
+            await self._notify_change(conn, user_id)
+
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("UPDATE users SET Lang = ? WHERE UserId = ?", (lang, user_id))
-                await db.commit()
-                logger.info(f"Language updated for user {user_id} to {lang}.")
+            await self.writer.submit(op)
+            logger.info(f"Language updated for user {user_id} to {lang}.")
         except Exception as e:
             logger.error(f"Error updating language for user {user_id}: {e}")
+        finally:
+            user_cache.invalidate(user_id)
 
-    async def get_all_users(self) -> list[int]:
-        """Get list of all user IDs."""
-        logger.debug("Getting all user IDs.")
-        rows = await self._execute_query("SELECT UserId FROM users", fetchall=True)
-        return [row[0] for row in rows] if rows else []
+    async def iter_user_ids(self, after: int = 0, skip_blocked: bool = False,
+                            batch_size: int = ITER_BATCH_SIZE) -> AsyncIterator[int]:
+        """Yield user IDs greater than after in ascending order, reading batch_size rows per query.
+
+        Pages are selected by UserId rather than OFFSET, so each query is an index range scan and users
+        created meanwhile are not skipped. With skip_blocked, users in BlockedUsers are left out.
+        """
+        logger.debug(f"Iterating user IDs after {after}.")
+        query = "SELECT UserId FROM Users WHERE UserId > ?"
+        if skip_blocked:
+            query += " AND UserId NOT IN (SELECT UserId FROM BlockedUsers)"
+        query += " ORDER BY UserId LIMIT ?"
+        while True:
+            rows = await self._execute_query(query, (after, batch_size), fetchall=True)
+            if not rows:
+                return
+            for row in rows:
+                yield row[0]
+            if len(rows) < batch_size:
+                return
+            after = rows[-1][0]
+
+    async def unblock_user(self, user_id: int) -> None:
+        """Remove a user from BlockedUsers, e.g. once they talk to the bot again.
+
+        Membership is checked on a reader first, so the writer is only used for users who are actually blocked.
+        """
+        if await self._execute_query("SELECT 1 FROM BlockedUsers WHERE UserId = ?", (user_id,), fetchone=True) is None:
+            return
+        try:
+            await self._execute_write("DELETE FROM BlockedUsers WHERE UserId = ?", (user_id,))
+        except Exception as e:
+            logger.error(f"Error unblocking user {user_id}: {e}")
+
+    async def _set_ban(self, user_id: int, banned: bool, ban_end: str | None) -> bool:
+        """Ban or unban a user in Users and, once committed, in the ban index; False if there is no such user."""
+        ban_end = normalize_ban_end(ban_end)
+        async def op(conn: aiosqlite.Connection) -> int:
+            cursor = await conn.execute("UPDATE Users SET IsBanned = ?, BanEnd = ? WHERE UserId = ?",
+                                        ('true' if banned else 'false', ban_end, user_id))
+            if cursor.rowcount:
+                await self._notify_change(conn, user_id)
+            return cursor.rowcount
+
+        try:
+            updated = await self.writer.submit(op) > 0
+        except Exception as e:
+            logger.error(f"Error {'banning' if banned else 'unbanning'} user {user_id}: {e}")
+            return False
+        finally:
+            user_cache.invalidate(user_id)
+        if updated:
+            if banned:
+                ban_index.ban(user_id, ban_end)
+            else:
+                ban_index.unban(user_id)
+        return updated
+
+    async def ban_user(self, user_id: int, ban_end: str | None = None) -> bool:
+        """Ban a user until ban_end (a BAN_END_FORMAT UTC time), or permanently without it."""
+        return await self._set_ban(user_id, True, ban_end)
+
+    async def unban_user(self, user_id: int) -> bool:
+        """Lift a user's ban."""
+        return await self._set_ban(user_id, False, None)
 
-    async def execute_update(self, query: str, params: tuple = ()) -> None:
-        """Execute an update query."""
+    async def lift_expired_bans(self) -> list[int]:
+        """Unban the users whose BanEnd has passed and return their IDs.
+
+        With the ban index loaded, only the bans it reports as ended are considered, up to DB_ITER_BATCH_SIZE
+        per call, and nothing is written while there are none. BanEnd is compared in SQL either way, so a
+        user banned again since the index was updated stays banned; such users are re-read into the index.
+        """
+        query = "UPDATE Users SET IsBanned = 'false', BanEnd = NULL WHERE IsBanned = 'true' AND BanEnd <= ?"
+        params = (format_ban_end(time.time()),)
+        expired = []
+        if ban_index.loaded:
+            expired = ban_index.expired()[:ITER_BATCH_SIZE]
+            if not expired:
+                return []
+            query += f" AND UserId IN ({', '.join('?' * len(expired))})"
+            params += tuple(expired)
+        query += " RETURNING UserId"
+
+        async def op(conn: aiosqlite.Connection) -> list[int]:
+            cursor = await conn.execute(query, params)
+            user_ids = [row[0] for row in await cursor.fetchall()]
+            for user_id in user_ids:
+                await self._notify_change(conn, user_id)
+            return user_ids
+
+        try:
+            user_ids = await self.writer.submit(op)
+        except Exception as e:
+            logger.error(f"Error lifting expired bans: {e}")
+            return []
+        for user_id in user_ids:
+            user_cache.invalidate(user_id)
+            ban_index.unban(user_id)
+        lifted = set(user_ids)
+        stale = [user_id for user_id in expired if user_id not in lifted]
+        if stale:
+            await self._refresh_bans(stale)
+        return user_ids
+
+    async def reset_penalty_left(self, value: int, chunk_size: int = BULK_UPDATE_CHUNK_SIZE) -> int:
+        """Refill PenaltyLeft to value for every user with fewer attempts and return how many were refilled.
+
+        Users are updated in UserId ranges of chunk_size rows, each in its own write, so other writes are
+        not held up for long on a large table. The whole user cache is cleared afterwards; other
+        processes' cached rows expire within DB_USER_CACHE_TTL.
+        """
+        async def op(conn: aiosqlite.Connection) -> tuple[int | None, int]:
+            cursor = await conn.execute("SELECT MAX(UserId) FROM (SELECT UserId FROM Users WHERE UserId > ? "
+                                        "ORDER BY UserId LIMIT ?)", (after, chunk_size))
+            (last,) = await cursor.fetchone()
+            if last is None:
+                return None, 0
+            cursor = await conn.execute("UPDATE Users SET PenaltyLeft = ? "
+                                        "WHERE UserId > ? AND UserId <= ? AND PenaltyLeft < ?", (value, after, last, value))
+            return last, cursor.rowcount
+
+        after, total = 0, 0
+        try:
+            while True:
+                last, updated = await self.writer.submit(op)
+                if last is None:
+                    return total
+                after, total = last, total + updated
+        finally:
+            user_cache.clear()
+            logger.info(f"Refilled penalty attempts of {total} users.")
+
+    async def claim_job_run(self, name: str, period_start: float) -> bool:
+        """Record in JobRuns that a job runs now unless it already ran since period_start; whether it was recorded."""
+        try:
+            return await self._execute_write("INSERT INTO JobRuns (Name, LastRunAt) VALUES (?, ?) "
+                                             "ON CONFLICT(Name) DO UPDATE SET LastRunAt = excluded.LastRunAt "
+                                             "WHERE LastRunAt < ?", (name, time.time(), period_start)) > 0
+        except Exception as e:
+            logger.error(f"Error claiming a run of job {name}: {e}")
+            return False
+
+    async def release_job_run(self, name: str) -> None:
+        """Forget the last run of a job that failed, so it is run again."""
+        try:
+            await self._execute_write("DELETE FROM JobRuns WHERE Name = ?", (name,))
+        except Exception as e:
+            logger.error(f"Error releasing the run of job {name}: {e}")
+
+    async def create_broadcast(self, broadcast: Broadcast) -> bool:
+        """Store a new broadcast and set its id."""
+        async def op(conn: aiosqlite.Connection) -> int:
+            cursor = await conn.execute("INSERT INTO Broadcasts (AdminId, ChatId, Text, FromChatId, MessageId) "
+                                        "VALUES (?, ?, ?, ?, ?) RETURNING Id",
+                                        (broadcast.admin_id, broadcast.chat_id, broadcast.text,
+                                         broadcast.from_chat_id, broadcast.message_id))
+            row = await cursor.fetchone()
+            await cursor.close()
+            return row[0]
+
+        try:
+            broadcast.id = await self.writer.submit(op)
+            return True
+        except Exception as e:
+            logger.error(f"Error creating broadcast: {e}")
+            return False
+
+    async def get_running_broadcasts(self) -> list[Broadcast]:
+        """Get every broadcast that was interrupted before it finished, oldest first."""
+        rows = await self._execute_query("SELECT Id, AdminId, ChatId, Text, FromChatId, MessageId, LastUserId, Sent, "
+                                         "Failed, Blocked FROM Broadcasts WHERE Status = 'running' ORDER BY Id",
+                                         fetchall=True)
+        return [Broadcast(id=row[0], admin_id=row[1], chat_id=row[2], text=row[3], from_chat_id=row[4],
+                          message_id=row[5], last_user_id=row[6], sent=row[7], failed=row[8], blocked=row[9])
+                for row in rows] if rows else []
+
+    async def save_broadcast_progress(self, broadcast: Broadcast, blocked_ids: list[int]) -> None:
+        """Checkpoint a broadcast and record the users who blocked the bot in one transaction."""
+        async def op(conn: aiosqlite.Connection) -> None:
+            if blocked_ids:
+                await conn.executemany("INSERT OR IGNORE INTO BlockedUsers (UserId) VALUES (?)",
+                                       [(user_id,) for user_id in blocked_ids])
+            await conn.execute("UPDATE Broadcasts SET Status = ?, LastUserId = ?, Sent = ?, Failed = ?, Blocked = ?, "
+                               "FinishedAt = CASE WHEN ? = 'running' THEN NULL ELSE datetime('now') END WHERE Id = ?",
+                               (broadcast.status, broadcast.last_user_id, broadcast.sent, broadcast.failed,
+                                broadcast.blocked, broadcast.status, broadcast.id))
+
+        try:
+            await self.writer.submit(op)
+        except Exception as e:
+            logger.error(f"Error saving progress of broadcast {broadcast.id}: {e}")
+
+    async def execute_update(self, query: str, params: tuple = (), user_id: int | None = None,
+                             refresh_success: bool = True) -> None:
+        """Execute an update query.
+
+        user_id names the only user the query changes, which limits user cache invalidation to that user;
+        without it the whole cache is cleared. Unless refresh_success is False, that user's
+        LeaderboardUsers row is also recalculated in the same transaction, so user_id must be passed for
+        every write that changes a stat counted by calculate_success.
+        """
         logger.debug(f"Executing update: {query} with params {params}")
+
+        async def op(conn: aiosqlite.Connection) -> int | None:
+            await conn.execute(query, params)
+            if user_id is not None and refresh_success:
+                return await self._refresh_success(conn, user_id)
+            return None
+
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute(query, params)
-                await db.commit()
+            success = await self.writer.submit(op)
+            if success is not None and rank_index.loaded:
+                rank_index.update(user_id, success)
         except Exception as e:
             logger.error(f"Error executing update: {e}")
+        finally:
+            if user_id is None:
+                user_cache.clear()
+            else:
+                user_cache.invalidate(user_id)
+
+    async def rebuild_leaderboard(self, chunk_size: int = BULK_UPDATE_CHUNK_SIZE) -> int:
+        """Recalculate LeaderboardUsers from scratch for every user.
+
+        Users are rebuilt in UserId ranges of chunk_size rows, each in its own write, so other writes are
+        not held up for long on a large table; a row of a user who no longer exists is deleted with its
+        range. A loaded rank index is reloaded from the table afterwards. Returns the number of
+        leaderboard rows written.
+        """
+        logger.info("Rebuilding leaderboard.")
+
+        async def op(conn: aiosqlite.Connection) -> tuple[int | None, int]:
+            cursor = await conn.execute("SELECT * FROM Users WHERE UserId > ? ORDER BY UserId LIMIT ?",
+                                        (after, chunk_size))
+            cursor.row_factory = user_record_factory
+            rows = [(user.user_id, calculate_success(user)) async for user in cursor]
+            await cursor.close()
+            if not rows:
+                await conn.execute("DELETE FROM LeaderboardUsers WHERE UserId > ?", (after,))
+                return None, 0
+            last = rows[-1][0]
+            await conn.execute("DELETE FROM LeaderboardUsers WHERE UserId > ? AND UserId <= ?", (after, last))
+            await conn.executemany("INSERT INTO LeaderboardUsers (UserId, Success) VALUES (?, ?)", rows)
+            return last, len(rows)
+
+        after, count = 0, 0
+        while True:
+            last, written = await self.writer.submit(op)
+            if last is None:
+                break
+            after, count = last, count + written
+        if rank_index.loaded:
+            await self.load_rank_index()
+        logger.info(f"Leaderboard rebuilt with {count} users.")
+        return count
+
+    async def check_rank_index(self) -> list[int]:
+        """Compare every user's rank in the rank index with the ranking computed by SQL.
+
+        Returns:
+            list[int]: The IDs of the users whose ranks differ.
+        """
+        rows = await self._execute_query("SELECT UserId, RANK() OVER (ORDER BY Success DESC) FROM LeaderboardUsers",
+                                         fetchall=True)
+        if rows is None:
+            logger.error("Could not rank the leaderboard in SQL.")
+            return []
+        mismatched = [user_id for user_id, rank in rows if rank_index.rank(user_id) != rank]
+        if mismatched:
+            logger.error(f"Rank index disagrees with SQL for {len(mismatched)} of {len(rows)} users.")
+        else:
+            logger.info(f"Rank index agrees with SQL for all {len(rows)} users.")
+        return mismatched
 
     async def get_nearby_opponents(self, user_id: int) -> list[int]:
         """Get list of nearby opponents based on leaderboard position (within 2 places up or down)."""
         logger.debug(f"Getting nearby opponents for user {user_id}.")
+        if rank_index.loaded:
+            return rank_index.nearby(user_id)
         position = await self.get_user_position(user_id)
         if position is None:
             return []
@@ -141,3 +619,111 @@ class Database:
         opponents = [row[0] for row in rows if row[0] != user_id] if rows else []
         return opponents
 
+    async def get_random_opponent(self, user_id: int) -> tuple[int, str, int] | None:
+        """Pick a random nearby opponent and return their ID, username and success in one joined query."""
+        candidates = await self.get_nearby_opponents(user_id)
+        if not candidates:
+            return None
+        placeholders = ", ".join("?" * len(candidates))
+        return await self._execute_query("SELECT u.UserId, u.Username, l.Success FROM Users u "
+                                         "JOIN LeaderboardUsers l ON l.UserId = u.UserId "
+                                         f"WHERE u.UserId IN ({placeholders}) ORDER BY RANDOM() LIMIT 1",
+                                         tuple(candidates), fetchone=True)
+
+    async def _spend(self, user_id: int, query: str, params: tuple, game: PendingGame | None = None) -> tuple | None:
+        """Run a conditional UPDATE ... RETURNING for one user and return its row, or None if the
+        condition did not hold. If the update succeeded and a game is given, it is stored in PendingGames
+        in the same transaction and its id is filled in."""
+        async def op(conn: aiosqlite.Connection) -> tuple | None:
+            cursor = await conn.execute(query, params)
+            row = await cursor.fetchone()
+            await cursor.close()
+            if row is not None and game is not None:
+                cursor = await conn.execute("INSERT INTO PendingGames (UserId, ChatId, Kind, Payload, DueAt) "
+                                            "VALUES (?, ?, ?, ?, ?) RETURNING Id",
+                                            (game.user_id, game.chat_id, game.kind, json.dumps(game.payload),
+                                             game.due_at))
+                game.id = (await cursor.fetchone())[0]
+                await cursor.close()
+            return row
+
+        try:
+            return await self.writer.submit(op)
+        except Exception as e:
+            logger.error(f"Error executing conditional update for user {user_id}: {e}")
+            return None
+        finally:
+            user_cache.invalidate(user_id)
+
+    async def spend_match_entry(self, user_id: int, coins: int, tickets: int,
+                                game: PendingGame | None = None) -> tuple[int, int] | None:
+        """Atomically deduct a match entry fee if the user can afford it, storing the pending game with it.
+
+        Returns the remaining (coins, tickets), or None if the user lacked resources.
+        """
+        logger.debug(f"Deducting match entry for user {user_id}.")
+        return await self._spend(user_id, "UPDATE Users SET Coins = Coins - ?, Tickets = Tickets - ? "
+                                          "WHERE UserId = ? AND Coins >= ? AND Tickets >= ? RETURNING Coins, Tickets",
+                                 (coins, tickets, user_id, coins, tickets), game)
+
+    async def spend_penalty_attempt(self, user_id: int, game: PendingGame | None = None) -> int | None:
+        """Atomically use one penalty attempt if the user has any left, storing the pending game with it.
+
+        Returns the number of attempts left afterwards, or None if there were none.
+        """
+        logger.debug(f"Deducting penalty attempt for user {user_id}.")
+        row = await self._spend(user_id, "UPDATE Users SET PenaltyLeft = PenaltyLeft - 1 "
+                                         "WHERE UserId = ? AND PenaltyLeft > 0 RETURNING PenaltyLeft", (user_id,),
+                                game)
+        return row[0] if row else None
+
+    async def get_pending_games(self) -> list[PendingGame]:
+        """Get every stored game that has not been resolved yet, oldest due first."""
+        rows = await self._execute_query("SELECT Id, UserId, ChatId, Kind, Payload, DueAt FROM PendingGames "
+                                         "ORDER BY DueAt", fetchall=True)
+        return [PendingGame(id=row[0], user_id=row[1], chat_id=row[2], kind=row[3], payload=json.loads(row[4]),
+                            due_at=row[5]) for row in rows] if rows else []
+
+    async def complete_game(self, game_id: int, query: str, params: tuple = (), user_id: int | None = None,
+                            refresh_success: bool = True) -> bool:
+        """Apply a game's result and delete it from PendingGames in one transaction.
+
+        Arguments after game_id are as for execute_update. Returns False without applying anything if the
+        game was already completed, so a result is never applied twice. Unlike most methods here, database
+        errors are logged and re-raised, so the caller can retry a game that is still pending.
+        """
+        logger.debug(f"Completing game {game_id}: {query} with params {params}")
+
+        async def op(conn: aiosqlite.Connection) -> tuple[bool, int | None]:
+            cursor = await conn.execute("DELETE FROM PendingGames WHERE Id = ?", (game_id,))
+            deleted = cursor.rowcount
+            await cursor.close()
+            if not deleted:
+                return False, None
+            await conn.execute(query, params)
+            if user_id is not None and refresh_success:
+                return True, await self._refresh_success(conn, user_id)
+            return True, None
+
+        try:
+            applied, success = await self.writer.submit(op)
+            if success is not None and rank_index.loaded:
+                rank_index.update(user_id, success)
+            return applied
+        except Exception as e:
+            logger.error(f"Error completing game {game_id}: {e}")
+            raise
+        finally:
+            if user_id is None:
+                user_cache.clear()
+            else:
+                user_cache.invalidate(user_id)
+
+    async def get_top_users(self, limit: int) -> list[int]:
+        """Get the IDs of the users at the first limit leaderboard positions."""
+        logger.debug(f"Getting top {limit} users.")
+        if rank_index.loaded:
+            return rank_index.top(limit)
+        rows = await self._execute_query("SELECT UserId FROM LeaderboardUsers ORDER BY Success DESC LIMIT ?",
+                                         (limit,), fetchall=True)
+        return [row[0] for row in rows] if rows else []
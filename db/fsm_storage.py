@@ -0,0 +1,112 @@
+﻿import json
+import time
+from os import getenv
+from typing import Any, Mapping
+
+import aiosqlite
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from db.change_sync import user_changes_sync
+from db.database import Database
+from db.ttl_cache import MISSING, TTLCache
+from utils.logging import logger
+
+FSM_STATE_TTL = float(getenv("FSM_STATE_TTL", "86400"))
+FSM_PURGE_INTERVAL = float(getenv("FSM_PURGE_INTERVAL", "3600"))
+FSM_CACHE_SIZE = int(getenv("FSM_CACHE_SIZE", "10000"))
+FSM_CACHE_TTL = float(getenv("FSM_CACHE_TTL", "30"))
+
+
+def _encode(data: Mapping[str, Any]) -> str | None:
+    """Serialize FSM data as compact JSON, or None when there is nothing to store."""
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False) if data else None
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage keeping states and data in the FsmStates table of the bot database.
+
+    States survive restarts and are shared by every process using the same database. A record expires
+    ttl seconds after its last change and expired records are purged by a later write. Stored records
+    are cached in-process per user for up to FSM_CACHE_TTL seconds; keys without a record are always
+    read from the database, so a state set by another process is seen by the next update. Every write
+    is recorded in UserChanges, and the user's cached records are dropped once the UserChanges sync
+    reports the change. Database errors are logged; a failed read is treated as no state.
+    """
+
+    def __init__(self, key_builder: KeyBuilder | None = None, ttl: float = FSM_STATE_TTL):
+        """Create a storage whose records expire ttl seconds after their last change."""
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self.ttl = ttl
+        self._db = Database()
+        self._cache = TTLCache(FSM_CACHE_SIZE, FSM_CACHE_TTL)
+        self._last_purge = 0.0
+        user_changes_sync.subscribe(self._forget)
+
+    def _forget(self, user_ids: list[int]) -> None:
+        """Drop the cached records of users changed by any process."""
+        for user_id in user_ids:
+            self._cache.invalidate(user_id)
+
+    async def _read(self, key: StorageKey) -> tuple[str | None, dict[str, Any]]:
+        """Return the state and data of a key, from the cache if possible."""
+        db_key = self.key_builder.build(key)
+        records = self._cache.get(key.user_id)
+        if records is not MISSING and db_key in records:
+            return records[db_key]
+        generation = self._cache.generation
+        try:
+            async with self._db.pool.acquire() as conn:
+                cursor = await conn.execute("SELECT State, Data FROM FsmStates WHERE Key = ? AND ExpiresAt > ?",
+                                            (db_key, time.time()))
+                row = await cursor.fetchone()
+                await cursor.close()
+        except Exception as e:
+            logger.error(f"Error reading FSM state {db_key}: {e}")
+            return None, {}
+        if row is None:
+            return None, {}
+        record = (row[0], json.loads(row[1]) if row[1] else {})
+        self._cache.put(key.user_id, {**(records if records is not MISSING else {}), db_key: record}, generation)
+        return record
+
+    async def _write(self, key: StorageKey, column: str, value: str | None) -> None:
+        """Set the State or Data column of a key, deleting records left with neither."""
+        db_key = self.key_builder.build(key)
+        now = time.time()
+        purge = now - self._last_purge >= FSM_PURGE_INTERVAL
+        if purge:
+            self._last_purge = now
+
+        async def op(conn: aiosqlite.Connection) -> None:
+            await conn.execute(f"INSERT INTO FsmStates (Key, {column}, ExpiresAt) VALUES (?, ?, ?) "
+                               f"ON CONFLICT(Key) DO UPDATE SET {column} = excluded.{column}, "
+                               f"ExpiresAt = excluded.ExpiresAt", (db_key, value, now + self.ttl))
+            await conn.execute("DELETE FROM FsmStates WHERE Key = ? AND State IS NULL AND Data IS NULL", (db_key,))
+            if purge:
+                await conn.execute("DELETE FROM FsmStates WHERE ExpiresAt <= ?", (now,))
+            await Database._notify_change(conn, key.user_id)
+
+        try:
+            await self._db.writer.submit(op)
+        except Exception as e:
+            logger.error(f"Error writing FSM state {db_key}: {e}")
+        finally:
+            self._cache.invalidate(key.user_id)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._write(key, "State", state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._read(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise ValueError(f"Data must be a dict, got {type(data).__name__}")
+        await self._write(key, "Data", _encode(data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return dict((await self._read(key))[1])
+
+    async def close(self) -> None:
+        """Nothing to release; the shared database connections are closed by Database.close()."""
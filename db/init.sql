@@ -1,4 +1,25 @@
 BEGIN TRANSACTION;
+CREATE TABLE IF NOT EXISTS "BlockedUsers" (
+	"UserId"	INTEGER NOT NULL,
+	"BlockedAt"	TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	PRIMARY KEY("UserId")
+);
+CREATE TABLE IF NOT EXISTS "Broadcasts" (
+	"Id"	INTEGER NOT NULL,
+	"AdminId"	INTEGER NOT NULL,
+	"ChatId"	INTEGER NOT NULL,
+	"Text"	TEXT,
+	"FromChatId"	INTEGER,
+	"MessageId"	INTEGER,
+	"Status"	TEXT NOT NULL DEFAULT 'running',
+	"LastUserId"	INTEGER NOT NULL DEFAULT 0,
+	"Sent"	INTEGER NOT NULL DEFAULT 0,
+	"Failed"	INTEGER NOT NULL DEFAULT 0,
+	"Blocked"	INTEGER NOT NULL DEFAULT 0,
+	"CreatedAt"	TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	"FinishedAt"	TEXT,
+	PRIMARY KEY("Id" AUTOINCREMENT)
+);
 CREATE TABLE IF NOT EXISTS "ClubMembers" (
 	"ClubId"	INTEGER NOT NULL,
 	"UserId"	INTEGER NOT NULL,
@@ -26,11 +47,38 @@ CREATE TABLE IF NOT EXISTS "Clubs" (
 	"ClubWarTrophies"	INTEGER NOT NULL DEFAULT 0,
 	PRIMARY KEY("Id" AUTOINCREMENT)
 );
+CREATE TABLE IF NOT EXISTS "FsmStates" (
+	"Key"	TEXT NOT NULL,
+	"State"	TEXT,
+	"Data"	TEXT,
+	"ExpiresAt"	REAL NOT NULL,
+	PRIMARY KEY("Key")
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS "JobRuns" (
+	"Name"	TEXT NOT NULL,
+	"LastRunAt"	REAL NOT NULL,
+	PRIMARY KEY("Name")
+);
 CREATE TABLE IF NOT EXISTS "LeaderboardUsers" (
 	"UserId"	INTEGER NOT NULL,
 	"Success"	INTEGER NOT NULL,
 	PRIMARY KEY("UserId")
 );
+CREATE TABLE IF NOT EXISTS "PendingGames" (
+	"Id"	INTEGER NOT NULL,
+	"UserId"	INTEGER NOT NULL,
+	"ChatId"	INTEGER NOT NULL,
+	"Kind"	TEXT NOT NULL,
+	"Payload"	TEXT NOT NULL DEFAULT '{}',
+	"DueAt"	REAL NOT NULL,
+	PRIMARY KEY("Id" AUTOINCREMENT)
+);
+CREATE TABLE IF NOT EXISTS "UserChanges" (
+	"Id"	INTEGER NOT NULL,
+	"UserId"	INTEGER NOT NULL,
+	"ChangedAt"	REAL NOT NULL,
+	PRIMARY KEY("Id" AUTOINCREMENT)
+);
 CREATE TABLE IF NOT EXISTS "Users" (
 	"UserId"	INTEGER NOT NULL UNIQUE,
 	"Username"	TEXT NOT NULL,
@@ -68,4 +116,13 @@ CREATE TABLE IF NOT EXISTS "Users" (
 CREATE INDEX IF NOT EXISTS "idx_success" ON "LeaderboardUsers" (
 	"Success"	DESC
 );
+CREATE INDEX IF NOT EXISTS "idx_pending_games_due" ON "PendingGames" (
+	"DueAt"
+);
+CREATE INDEX IF NOT EXISTS "idx_fsm_states_expires" ON "FsmStates" (
+	"ExpiresAt"
+);
+CREATE INDEX IF NOT EXISTS "idx_users_ban_end" ON "Users" (
+	"BanEnd"
+) WHERE "IsBanned" = 'true';
 COMMIT;
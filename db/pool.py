@@ -0,0 +1,102 @@
+﻿import asyncio
+from contextlib import asynccontextmanager
+from os import getenv
+from typing import AsyncIterator
+
+import aiosqlite
+
+from utils.logging import logger
+
+POOL_SIZE = int(getenv("DB_POOL_SIZE", "4"))
+MMAP_SIZE = int(getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+CACHE_SIZE_KIB = int(getenv("DB_CACHE_SIZE_KIB", "20000"))
+BUSY_TIMEOUT_MS = int(getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA mmap_size = {MMAP_SIZE}",
+    f"PRAGMA cache_size = -{CACHE_SIZE_KIB}",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+async def open_connection(db_path: str, **kwargs) -> aiosqlite.Connection:
+    """Open a single aiosqlite connection and apply the tuned pragmas to it."""
+    conn = await aiosqlite.connect(db_path, **kwargs)
+    for pragma in PRAGMAS:
+        await conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """Fixed-size pool of long-lived aiosqlite connections.
+
+    Every connection owns one worker thread for its whole lifetime, so queries no longer pay for
+    spawning a thread and re-opening the database file. Once closed, the pool only opens again through
+    an explicit open(); acquire() raises instead, so a late query during shutdown cannot leak connections.
+    """
+
+    def __init__(self, db_path: str, size: int = POOL_SIZE):
+        """Store pool settings; connections are opened lazily by open()."""
+        self.db_path = db_path
+        self.size = max(1, size)
+        self._connections: list[aiosqlite.Connection] = []
+        self._idle: asyncio.Queue[aiosqlite.Connection] | None = None
+        self._closed = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        """Whether the pool currently holds open connections."""
+        return self._idle is not None
+
+    async def open(self) -> None:
+        """Open all pooled connections, doing nothing if the pool is already open."""
+        async with self._lock:
+            if self.is_open:
+                return
+            idle: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+            for _ in range(self.size):
+                conn = await open_connection(self.db_path)
+                self._connections.append(conn)
+                idle.put_nowait(conn)
+            self._idle = idle
+            self._closed = False
+            logger.info(f"Opened database pool with {self.size} connections to {self.db_path}.")
+
+    async def close(self) -> None:
+        """Close every pooled connection."""
+        async with self._lock:
+            self._closed = True
+            if not self.is_open:
+                return
+            self._idle = None
+            connections, self._connections = self._connections, []
+            for conn in connections:
+                try:
+                    await conn.close()
+                except Exception as e:
+                    logger.error(f"Error closing pooled connection: {e}")
+            logger.info("Database pool closed.")
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a connection for the duration of the context, opening the pool on first use.
+
+        Raises:
+            RuntimeError: If the pool was closed.
+        """
+        if not self.is_open:
+            if self._closed:
+                raise RuntimeError("The database connection pool is closed")
+            await self.open()
+        idle = self._idle
+        conn = await idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                await conn.rollback()
+            idle.put_nowait(conn)
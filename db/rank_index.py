@@ -0,0 +1,182 @@
+﻿from math import gcd
+
+import game.constants as constants
+
+# Every success score is an integer combination of these coefficients, so bucketing by their gcd keeps
+# equal scores in the same bucket and different scores in different buckets.
+BUCKET_WIDTH = gcd(constants.VICTORY_COEFFICIENT, constants.DEFEAT_COEFFICIENT,
+                   constants.SMALL_PACK_COEFFICIENT, constants.MEDIUM_PACK_COEFFICIENT,
+                   constants.BIG_PACK_COEFFICIENT, constants.REFERRALS_COEFFICIENT)
+MIN_SUCCESS = -constants.MAX_SUCCESS
+
+
+class RankIndex:
+    """In-memory order-statistic index over leaderboard success scores.
+
+    A Fenwick tree counts users per success bucket (bucket 0 holds the highest scores), and each
+    bucket keeps its users in a list with a reverse position map so members can be added, removed
+    and addressed by offset in O(1). Rank, k-th user and top-N lookups therefore cost O(log B) for
+    B buckets regardless of the number of users. The buckets initially cover [MIN_SUCCESS, MAX_SUCCESS];
+    a score outside the covered range widens it and rebuilds the index, so scores are never clamped.
+    """
+
+    def __init__(self, low: int = MIN_SUCCESS, high: int = constants.MAX_SUCCESS, width: int = BUCKET_WIDTH):
+        """Create an empty index covering success scores from low to high."""
+        self.low = low
+        self.high = high
+        self.width = width
+        self.size = (high - low) // width + 1
+        self.loaded = False
+        self._clear()
+
+    def _clear(self) -> None:
+        """Drop every user from the index."""
+        self._tree = [0] * (self.size + 1)
+        self._buckets: dict[int, list[int]] = {}
+        self._where: dict[int, tuple[int, int]] = {}
+        self._success: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._where
+
+    def _bucket(self, success: int) -> int:
+        """Bucket number for a success score, with higher scores in lower buckets."""
+        return (self.high - success) // self.width
+
+    def _grow(self, success: int) -> bool:
+        """Widen the covered range, at least doubling it, until it includes success; whether it changed.
+
+        The bounds move by whole buckets so equal scores keep sharing a bucket. The caller rebuilds the tree.
+        """
+        if self.low <= success <= self.high:
+            return False
+        step = (self.high - self.low) // self.width * self.width + self.width
+        while success > self.high:
+            self.high += step
+        while success < self.low:
+            self.low -= step
+        self.size = (self.high - self.low) // self.width + 1
+        return True
+
+    def _add(self, bucket: int, delta: int) -> None:
+        """Add delta to the user count of a bucket."""
+        i = bucket + 1
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _count_before(self, bucket: int) -> int:
+        """Number of users in buckets strictly before the given one."""
+        total = 0
+        i = bucket
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def load(self, rows) -> None:
+        """Replace the index contents with (user_id, success) rows, building the tree in O(n + B)."""
+        rows = list(rows)
+        for _, success in rows:
+            self._grow(success)
+        self._clear()
+        counts = [0] * (self.size + 1)
+        for user_id, success in rows:
+            bucket = self._bucket(success)
+            members = self._buckets.setdefault(bucket, [])
+            self._where[user_id] = (bucket, len(members))
+            self._success[user_id] = success
+            members.append(user_id)
+            counts[bucket + 1] += 1
+        for i in range(1, self.size + 1):
+            counts[i] += counts[i - 1]
+        for i in range(1, self.size + 1):
+            self._tree[i] = counts[i] - counts[i - (i & -i)]
+        self.loaded = True
+
+    def remove(self, user_id: int) -> None:
+        """Remove a user from the index if present."""
+        location = self._where.pop(user_id, None)
+        if location is None:
+            return
+        bucket, pos = location
+        del self._success[user_id]
+        members = self._buckets[bucket]
+        last = members.pop()
+        if last != user_id:
+            members[pos] = last
+            self._where[last] = (bucket, pos)
+        if not members:
+            del self._buckets[bucket]
+        self._add(bucket, -1)
+
+    def update(self, user_id: int, success: int) -> None:
+        """Insert a user or move them to the bucket of their new success score."""
+        if self._grow(success):
+            rows = dict(self._success)
+            rows[user_id] = success
+            loaded = self.loaded
+            self.load(rows.items())
+            self.loaded = loaded
+            return
+        bucket = self._bucket(success)
+        location = self._where.get(user_id)
+        if location is not None and location[0] == bucket:
+            self._success[user_id] = success
+            return
+        self.remove(user_id)
+        members = self._buckets.setdefault(bucket, [])
+        self._where[user_id] = (bucket, len(members))
+        self._success[user_id] = success
+        members.append(user_id)
+        self._add(bucket, 1)
+
+    def success(self, user_id: int) -> int | None:
+        """Indexed success score of a user."""
+        return self._success.get(user_id)
+
+    def rank(self, user_id: int) -> int | None:
+        """1-based leaderboard position: one more than the number of users with a higher score."""
+        location = self._where.get(user_id)
+        if location is None:
+            return None
+        return self._count_before(location[0]) + 1
+
+    def at(self, offset: int) -> int | None:
+        """User at a 0-based offset of the leaderboard ordered by success descending."""
+        if offset < 0 or offset >= len(self._where):
+            return None
+        bucket = 0
+        step = 1 << self.size.bit_length()
+        remaining = offset
+        while step:
+            nxt = bucket + step
+            if nxt <= self.size and self._tree[nxt] <= remaining:
+                bucket = nxt
+                remaining -= self._tree[nxt]
+            step >>= 1
+        return self._buckets[bucket][remaining]
+
+    def between(self, start: int, end: int) -> list[int]:
+        """Users at 1-based positions start..end inclusive."""
+        users = []
+        for offset in range(max(start, 1) - 1, min(end, len(self._where))):
+            users.append(self.at(offset))
+        return users
+
+    def nearby(self, user_id: int, radius: int = 2) -> list[int]:
+        """Users within radius places above or below a user's position, excluding the user."""
+        position = self.rank(user_id)
+        if position is None:
+            return []
+        return [u for u in self.between(position - radius, position + radius) if u != user_id]
+
+    def top(self, limit: int) -> list[int]:
+        """Users at the first limit positions."""
+        return self.between(1, limit)
+
+
+rank_index = RankIndex()
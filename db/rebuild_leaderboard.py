@@ -0,0 +1,36 @@
+﻿"""
+Leaderboard rebuild
+----------------------------------
+One-shot command that recalculates LeaderboardUsers for every user of an existing database.
+Run it once after upgrading a database whose leaderboard was never populated:
+
+    python -m db.rebuild_leaderboard
+
+With --check it instead loads the in-memory rank index as the bot does at startup and compares every
+user's rank with the ranking computed by SQL, exiting with status 1 if they differ:
+
+    python -m db.rebuild_leaderboard --check
+"""
+
+import asyncio
+import sys
+
+from db.database import Database
+
+
+async def main(check: bool = False) -> bool:
+    """Rebuild the leaderboard, or only check the rank index against SQL, and close the database
+    connections. Returns False if the check found users ranked differently."""
+    db = Database()
+    try:
+        if check:
+            await db.open()
+            return not await db.check_rank_index()
+        await db.rebuild_leaderboard()
+        return True
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main("--check" in sys.argv[1:])) else 1)
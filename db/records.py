@@ -0,0 +1,115 @@
+﻿import sqlite3
+from dataclasses import dataclass, field
+
+
+@dataclass(frozen=True, slots=True)
+class UserRecord:
+    """One row of the Users table.
+
+    Built by user_record_factory from the column names of the result set, so queries do not
+    depend on the physical column order of the table. No field has a default, so a record can
+    only be built from a full row; the defaults of new users live in the schema alone.
+    """
+    user_id: int
+    username: str
+    user_info: str | None
+    user_avatar_id: str | None
+    telegram_username: str | None
+    telegram_first_name: str | None
+    telegram_last_name: str | None
+    telegram_phone_number: str | None
+    coins: int
+    tickets: int
+    cups: int
+    victories: int
+    defeats: int
+    games_played: int
+    penalty_left: int
+    penalty_scored: int
+    referrals_count: int
+    received_coins: int
+    received_tickets: int
+    ghost_small_packs: int
+    ghost_medium_packs: int
+    ghost_big_packs: int
+    small_packs: int
+    medium_packs: int
+    big_packs: int
+    is_banned: str
+    ban_end: str | None
+    warns: int
+    level: int
+    register_date: str | None
+    lang: str | None
+
+
+# Users column name -> UserRecord field name
+USER_COLUMNS = {
+    "UserId": "user_id",
+    "Username": "username",
+    "UserInfo": "user_info",
+    "UserAvatarId": "user_avatar_id",
+    "TelegramUsername": "telegram_username",
+    "TelegramFirstName": "telegram_first_name",
+    "TelegramLastName": "telegram_last_name",
+    "TelegramPhoneNumber": "telegram_phone_number",
+    "Coins": "coins",
+    "Tickets": "tickets",
+    "Cups": "cups",
+    "Victories": "victories",
+    "Defeats": "defeats",
+    "GamesPlayed": "games_played",
+    "PenaltyLeft": "penalty_left",
+    "PenaltyScored": "penalty_scored",
+    "ReferralsCount": "referrals_count",
+    "ReceivedCoins": "received_coins",
+    "ReceivedTickets": "received_tickets",
+    "GhostSmallPacks": "ghost_small_packs",
+    "GhostMediumPacks": "ghost_medium_packs",
+    "GhostBigPacks": "ghost_big_packs",
+    "SmallPacks": "small_packs",
+    "MediumPacks": "medium_packs",
+    "BigPacks": "big_packs",
+    "IsBanned": "is_banned",
+    "BanEnd": "ban_end",
+    "Warns": "warns",
+    "Level": "level",
+    "RegisterDate": "register_date",
+    "Lang": "lang",
+}
+
+
+def user_record_factory(cursor: sqlite3.Cursor, row: tuple) -> UserRecord:
+    """sqlite3 row factory turning a Users row into a UserRecord."""
+    return UserRecord(**{USER_COLUMNS[column[0]]: value for column, value in zip(cursor.description, row)})
+
+
+@dataclass(slots=True)
+class PendingGame:
+    """A started game whose result is due at due_at (a Unix timestamp); id is set once it is stored."""
+    user_id: int
+    chat_id: int
+    kind: str
+    due_at: float
+    payload: dict = field(default_factory=dict)
+    id: int | None = None
+
+
+@dataclass(slots=True)
+class Broadcast:
+    """A message sent to every user, either text or a copy of message_id from from_chat_id.
+
+    Users are messaged in UserId order and last_user_id is the last one whose delivery was saved, so an
+    interrupted broadcast resumes after it.
+    """
+    admin_id: int
+    chat_id: int
+    text: str | None = None
+    from_chat_id: int | None = None
+    message_id: int | None = None
+    status: str = 'running'
+    last_user_id: int = 0
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    id: int | None = None
@@ -0,0 +1,78 @@
+﻿import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU cache with a per-entry time to live.
+
+    Any value can be cached, None included; get() returns MISSING for absent and expired keys. A read
+    remembers the generation before it starts and passes it to put(), which drops the value if that key
+    was invalidated, or the cache cleared, since. Invalidations are tracked per key, so a write to one key
+    does not discard reads of the others; the oldest of at most max_size tracked keys are folded into a
+    floor that applies to every key.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        """Create an empty cache holding at most max_size entries for ttl seconds each."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._floor = 0
+        self._invalidated: OrderedDict[Hashable, int] = OrderedDict()
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value or MISSING, counting the hit or miss."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return MISSING
+
+    def put(self, key: Hashable, value: Any, generation: int) -> None:
+        """Store a value read while the cache was at the given generation, unless it was invalidated since."""
+        if self.max_size <= 0 or max(self._floor, self._invalidated.get(key, 0)) > generation:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Forget a single entry."""
+        self.generation += 1
+        self._invalidated[key] = self.generation
+        self._invalidated.move_to_end(key)
+        while len(self._invalidated) > max(self.max_size, 1):
+            self._floor = self._invalidated.popitem(last=False)[1]
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Forget every entry."""
+        self.generation += 1
+        self._floor = self.generation
+        self._invalidated.clear()
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,22 @@
+﻿from os import getenv
+
+from db.ttl_cache import MISSING, TTLCache
+
+CACHE_SIZE = int(getenv("DB_USER_CACHE_SIZE", "10000"))
+CACHE_TTL = float(getenv("DB_USER_CACHE_TTL", "60"))
+
+
+class UserCache(TTLCache):
+    """Cache of Users rows keyed by user ID.
+
+    Rows that do not exist are cached as None so unregistered users do not hit the database on
+    every update either. Every write through Database invalidates the affected entries, and a read
+    that raced with a write to the same user does not store its stale row.
+    """
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        """Create an empty cache holding at most max_size rows for ttl seconds each."""
+        super().__init__(max_size, ttl)
+
+
+user_cache = UserCache()
@@ -0,0 +1,149 @@
+﻿import asyncio
+import time
+from os import getenv
+from typing import Any, Awaitable, Callable
+
+import aiosqlite
+
+from db.pool import open_connection
+from utils.logging import logger
+
+BATCH_SIZE = int(getenv("DB_WRITE_BATCH_SIZE", "128"))
+BATCH_DELAY = float(getenv("DB_WRITE_BATCH_DELAY_MS", "5")) / 1000
+
+WriteOp = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+
+class WriteQueue:
+    """Single-writer group-commit queue.
+
+    All writes are funnelled to one dedicated connection. The writer task collects up to
+    BATCH_SIZE requests (or whatever arrives within BATCH_DELAY of the first one), applies them
+    inside a single transaction with a savepoint per request, commits once and then resolves each
+    caller's future. A failing request is rolled back to its savepoint without affecting the rest
+    of the batch. Once stop() is called, the writer only starts again through an explicit start();
+    submit() raises instead.
+    """
+
+    def __init__(self, db_path: str, batch_size: int = BATCH_SIZE, batch_delay: float = BATCH_DELAY):
+        """Store writer settings; the connection and task are created by start()."""
+        self.db_path = db_path
+        self.batch_size = max(1, batch_size)
+        self.batch_delay = batch_delay
+        self._queue: asyncio.Queue[tuple[WriteOp, asyncio.Future]] = asyncio.Queue()
+        self._conn: aiosqlite.Connection | None = None
+        self._task: asyncio.Task | None = None
+        self._stopped = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the writer task is alive."""
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        """Open the writer connection and start the writer task if it is not running yet."""
+        async with self._lock:
+            if self.is_running:
+                return
+            self._conn = await open_connection(self.db_path, isolation_level=None)
+            self._task = asyncio.create_task(self._run(), name="db-writer")
+            self._stopped = False
+            logger.info("Database writer started.")
+
+    async def stop(self) -> None:
+        """Apply every queued request, then stop the writer task and close its connection."""
+        self._stopped = True
+        async with self._lock:
+            if not self.is_running:
+                return
+            await self._queue.join()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await self._conn.close()
+            self._conn = None
+            logger.info("Database writer stopped.")
+
+    async def submit(self, op: WriteOp) -> Any:
+        """Queue a write operation and wait until its batch is committed.
+
+        Returns whatever op returned, or raises the exception op (or the commit) raised.
+
+        Raises:
+            RuntimeError: If the writer was stopped.
+        """
+        if self._stopped:
+            raise RuntimeError("The database writer is stopped")
+        if not self.is_running:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((op, future))
+        return await future
+
+    @property
+    def depth(self) -> int:
+        """Number of write requests waiting for the writer."""
+        return self._queue.qsize()
+
+    async def _collect(self) -> list[tuple[WriteOp, asyncio.Future]]:
+        """Wait for one request, then gather more until the batch is full or the delay elapses."""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.batch_delay
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except TimeoutError:
+                break
+        return batch
+
+    async def _apply(self, batch: list[tuple[WriteOp, asyncio.Future]]) -> None:
+        """Run a batch in one transaction and resolve its futures after the commit."""
+        outcomes: list[tuple[bool, Any]] = []
+        try:
+            await self._conn.execute("BEGIN IMMEDIATE")
+            for op, _ in batch:
+                await self._conn.execute("SAVEPOINT write_op")
+                try:
+                    result = await op(self._conn)
+                except Exception as e:
+                    await self._conn.execute("ROLLBACK TO write_op")
+                    outcomes.append((False, e))
+                else:
+                    outcomes.append((True, result))
+                await self._conn.execute("RELEASE write_op")
+            await self._conn.execute("COMMIT")
+            logger.debug(f"Committed write batch of {len(batch)} requests.")
+        except Exception as e:
+            logger.error(f"Write batch of {len(batch)} failed: {e}")
+            if self._conn.in_transaction:
+                await self._conn.execute("ROLLBACK")
+            outcomes = [(False, e)] * len(batch)
+        for (_, future), (ok, value) in zip(batch, outcomes):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    async def _run(self) -> None:
+        """Writer loop: collect, apply and acknowledge batches until cancelled."""
+        while True:
+            batch = await self._collect()
+            try:
+                await self._apply(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
@@ -0,0 +1,119 @@
+﻿import time
+from collections import Counter
+from dataclasses import replace
+from os import getenv
+from typing import Awaitable, Callable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+from db.database import Database
+from db.records import PendingGame
+from utils.logging import logger
+from utils.scheduler import TimerWheel
+from utils.workers.sharding import Shard
+
+Resolver = Callable[[PendingGame], Awaitable[str | None]]
+
+# A game whose resolver fails is retried after GAME_RETRY_DELAY seconds, doubling per attempt up to the maximum.
+GAME_RETRY_DELAY = float(getenv("GAME_RETRY_DELAY", "5"))
+GAME_RETRY_MAX_DELAY = float(getenv("GAME_RETRY_MAX_DELAY", "300"))
+
+
+class GameEngine:
+    """Resolves started games when they are due without keeping a handler coroutine alive.
+
+    Games are stored in PendingGames in the same transaction that charges the player, scheduled on a
+    timer wheel, and resolved by the resolver registered for their kind, which applies the result and
+    returns the message to deliver. The message replaces the game's start message (payload["message_id"])
+    when there is one, so a game occupies a single message in the chat. Games still pending after a restart are loaded by start() and
+    resolved immediately if their due time has passed. A game whose resolver fails, e.g. on a database error,
+    is still stored and is scheduled again with exponential backoff.
+    """
+
+    def __init__(self):
+        """Create an engine without resolvers; start() must be called before games are resolved."""
+        self._resolvers: dict[str, Resolver] = {}
+        self._wheel = TimerWheel()
+        self._pending: Counter[int] = Counter()
+        self._retries: Counter[int] = Counter()
+        self._bot: Bot | None = None
+
+    def register(self, kind: str, resolver: Resolver) -> None:
+        """Register the coroutine resolving games of a kind."""
+        self._resolvers[kind] = resolver
+
+    def has_pending(self, user_id: int) -> bool:
+        """Whether a game of the user is waiting to be resolved."""
+        return self._pending[user_id] > 0
+
+    @property
+    def pending_count(self) -> int:
+        """Number of games waiting to be resolved."""
+        return self._pending.total()
+
+    def schedule(self, game: PendingGame) -> None:
+        """Resolve a stored game when it is due."""
+        self._pending[game.user_id] += 1
+        self._wheel.schedule(game.due_at - time.time(), lambda: self._resolve(game))
+        logger.debug(f"Scheduled {game.kind} game {game.id} for user {game.user_id}.")
+
+    async def start(self, bot: Bot, shard: Shard | None = None) -> None:
+        """Start the timer wheel and schedule every game left pending by a previous run, only those of
+        the shard's users if one is given."""
+        self._bot = bot
+        self._wheel.start()
+        games = [game for game in await Database().get_pending_games() if shard is None or shard.owns(game.user_id)]
+        for game in games:
+            self.schedule(game)
+        logger.info(f"Game engine started, resumed {len(games)} pending games.")
+
+    async def stop(self) -> None:
+        """Stop the timer wheel; unresolved games stay stored and are resumed by the next start()."""
+        await self._wheel.stop()
+        logger.info(f"Game engine stopped with {self.pending_count} games pending.")
+
+    async def _deliver(self, game: PendingGame, text: str) -> None:
+        """Edit a game's start message into its result, sending a new message if it cannot be edited."""
+        message_id = game.payload.get("message_id")
+        if message_id is not None:
+            try:
+                await self._bot.edit_message_text(text, chat_id=game.chat_id, message_id=message_id)
+                return
+            except TelegramBadRequest as e:
+                logger.debug(f"Could not edit the start message of {game.kind} game {game.id}: {e}")
+        await self._bot.send_message(game.chat_id, text)
+
+    async def _resolve(self, game: PendingGame) -> None:
+        """Apply a due game's result and deliver its message."""
+        try:
+            resolver = self._resolvers.get(game.kind)
+            if resolver is None:
+                logger.error(f"No resolver registered for {game.kind} game {game.id}.")
+                return
+            try:
+                text = await resolver(game)
+            except Exception as e:
+                self._retry(game, e)
+                return
+            self._retries.pop(game.id, None)
+            if text:
+                await self._deliver(game, text)
+        except Exception as e:
+            logger.error(f"Error resolving {game.kind} game {game.id} for user {game.user_id}: {e}")
+        finally:
+            self._pending[game.user_id] -= 1
+            if self._pending[game.user_id] <= 0:
+                del self._pending[game.user_id]
+
+
+    def _retry(self, game: PendingGame, error: Exception) -> None:
+        """Schedule a game whose resolver failed again, backing off exponentially."""
+        self._retries[game.id] += 1
+        delay = min(GAME_RETRY_MAX_DELAY, GAME_RETRY_DELAY * 2 ** (self._retries[game.id] - 1))
+        logger.error(f"Error resolving {game.kind} game {game.id} for user {game.user_id}, "
+                     f"retrying in {delay:.0f}s: {error}")
+        self.schedule(replace(game, due_at=time.time() + delay))
+
+
+game_engine = GameEngine()
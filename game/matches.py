@@ -1,37 +1,49 @@
-﻿import asyncio
-import random
+﻿import random
+import time
 
 import game.constants as constants
 from db.database import Database
+from db.records import PendingGame, UserRecord
+from game.engine import game_engine
 from utils.i18n import tr, get_loss_reasons
-from utils.user import get_user, get_full_stats
-from utils.user_fields import *
 
 
-async def play_match(user_id: int) -> dict:
-    """Simulate a match for the user, deducting resources, finding a nearby opponent from the
-    leaderboard, simulating scores, determining the result, updating the database, and returning
-    messages for start and result."""
-    user_data = await get_user(user_id)
-    if user_data[COINS] < constants.MATCH_COST_COINS or user_data[TICKETS] < constants.MATCH_COST_TICKETS:
+def _can_afford(user_data: UserRecord) -> bool:
+    """Check a loaded user row against the match entry fee."""
+    return user_data.coins >= constants.MATCH_COST_COINS and user_data.tickets >= constants.MATCH_COST_TICKETS
+
+
+async def play_match(user_id: int, user_data: UserRecord | None = None, chat_id: int | None = None,
+                     message_id: int | None = None) -> dict:
+    """Start a match for the user: pick a nearby opponent from the leaderboard, atomically deduct the
+    entry fee together with storing the pending match, schedule its resolution and return the start
+    message. The result is delivered to chat_id (the user's private chat by default) by the game engine,
+    which edits message_id into it if given. An already loaded user row can be passed in as user_data to
+    reject users who obviously cannot afford the match without touching the database."""
+    if user_data is not None and not _can_afford(user_data):
         return {"error": await tr(user_id, 'messages.insufficient_resources')}
 
     db = Database()
-    await db.execute_update("UPDATE users SET Coins = Coins - ?, Tickets = Tickets - ? WHERE UserId = ?",
-                            (constants.MATCH_COST_COINS, constants.MATCH_COST_TICKETS, user_id))
-
-    nearby_opponents = await db.get_nearby_opponents(user_id)
-    if not nearby_opponents:
+    opponent = await db.get_random_opponent(user_id)
+    if opponent is None:
         return {"error": await tr(user_id, 'messages.no_opponents')}
+    _, opp_name, opp_success = opponent
+
+    wait_time = random.randint(constants.MATCH_WAIT_MIN, constants.MATCH_WAIT_MAX)
+    game = PendingGame(user_id=user_id, chat_id=chat_id or user_id, kind="match", due_at=time.time() + wait_time,
+                       payload={"message_id": message_id} if message_id else {})
+    if await db.spend_match_entry(user_id, constants.MATCH_COST_COINS, constants.MATCH_COST_TICKETS, game) is None:
+        return {"error": await tr(user_id, 'messages.insufficient_resources')}
+    game_engine.schedule(game)
 
-    best_opponent = random.choice(nearby_opponents)
-    opp_data = await get_user(best_opponent)
-    opp_name = opp_data[USERNAME]
-    opp_stats = await get_full_stats(best_opponent)
-    opp_success = opp_stats['success']
     match_start_msg = await tr(user_id, 'messages.match_start')
+    return {"start_msg": match_start_msg.format(opponent=opp_name, success=opp_success)}
+
 
-    await asyncio.sleep(random.randint(constants.MATCH_WAIT_MIN, constants.MATCH_WAIT_MAX))
+async def resolve_match(game: PendingGame) -> str | None:
+    """Simulate the scores of a due match, apply the result to the database and return the result
+    message, or None if the match had already been resolved."""
+    user_id = game.user_id
     player1_score = random.randint(constants.MATCH_MIN_SCORE, constants.MATCH_MAX_SCORE)
     player2_score = random.randint(constants.MATCH_MIN_SCORE, constants.MATCH_MAX_SCORE)
 
@@ -43,12 +55,11 @@ async def play_match(user_id: int) -> dict:
         result_msg = await tr(user_id, 'messages.match_win')
         result = result_msg.format(score1=player1_score, score2=player2_score)
     elif player1_score < player2_score:
-        loss_reasons = get_loss_reasons(user_id)
-        reason = random.choice(loss_reasons)
         update_query = ("UPDATE users SET Defeats = Defeats + 1, GamesPlayed = GamesPlayed + 1 WHERE "
                         "UserId = ?")
         params = (user_id,)
         result_msg = await tr(user_id, 'messages.match_lose')
+        reason = random.choice(get_loss_reasons(user_id))
         result = result_msg.format(score1=player1_score, score2=player2_score, reason=reason)
     else:
         update_query = "UPDATE users SET GamesPlayed = GamesPlayed + 1 WHERE UserId = ?"
@@ -56,6 +67,9 @@ async def play_match(user_id: int) -> dict:
         result_msg = await tr(user_id, 'messages.match_draw')
         result = result_msg.format(score1=player1_score, score2=player2_score)
 
-    await db.execute_update(update_query, params)
+    if not await Database().complete_game(game.id, update_query, params, user_id=user_id):
+        return None
+    return result
+
 
-    return {"start_msg": match_start_msg.format(opponent=opp_name, success=opp_success), "result": result}
+game_engine.register("match", resolve_match)
@@ -1,37 +1,62 @@
-﻿import asyncio
-import random
+﻿import random
+import time
+from os import getenv
 
 import game.constants as constants
 from db.database import Database
+from db.records import PendingGame, UserRecord
+from game.engine import game_engine
 from utils.i18n import tr
-from utils.user import get_user, get_full_stats
-from utils.user_fields import *
+from utils.scheduler import SCHEDULES, job_scheduler
+from utils.user import get_full_stats
 
+# How often penalty attempts are refilled: "daily" (at 00:00 UTC) or "hourly".
+PENALTY_RESET_SCHEDULE = getenv("PENALTY_RESET_SCHEDULE", "daily")
+if PENALTY_RESET_SCHEDULE not in SCHEDULES:
+    raise ValueError(f"PENALTY_RESET_SCHEDULE must be one of {', '.join(SCHEDULES)}, got {PENALTY_RESET_SCHEDULE!r}")
 
-async def play_penalty(user_id: int) -> dict:
-    """Simulate a penalty series for the user, checking attempts, deducting one attempt, waiting a random time, simulating goals, updating coins and received coins, and returning messages for start and result."""
-    user_data = await get_user(user_id)
-    if user_data[PENALTY_LEFT] <= 0:
+
+async def play_penalty(user_id: int, user_data: UserRecord | None = None, chat_id: int | None = None,
+                       message_id: int | None = None) -> dict:
+    """Start a penalty series for the user, atomically deducting one attempt if any are left together with storing the pending series, scheduling its resolution after a random time and returning the start message. The result is delivered to chat_id (the user's private chat by default) by the game engine, which edits message_id into it if given. An already loaded user row can be passed in as user_data."""
+    if user_data is not None and user_data.penalty_left <= 0:
+        return {"error": await tr(user_id, 'messages.no_attempts_left')}
+
+    wait_time = random.randint(constants.PENALTY_WAIT_MIN, constants.PENALTY_WAIT_MAX)
+    game = PendingGame(user_id=user_id, chat_id=chat_id or user_id, kind="penalty", due_at=time.time() + wait_time,
+                       payload={"message_id": message_id} if message_id else {})
+    if await Database().spend_penalty_attempt(user_id, game) is None:
         return {"error": await tr(user_id, 'messages.no_attempts_left')}
+    game_engine.schedule(game)
 
     match_started_msg = await tr(user_id, 'messages.match_started')
+    return {"start_msg": match_started_msg}
 
-    db = Database()
-    await db.execute_update("UPDATE users SET PenaltyLeft = PenaltyLeft - 1 WHERE UserId = ?", (user_id,))
-    wait_time = random.randint(constants.PENALTY_WAIT_MIN, constants.PENALTY_WAIT_MAX)
-    await asyncio.sleep(wait_time)
 
+async def resolve_penalty(game: PendingGame) -> str | None:
+    """Simulate the goals of a due penalty series, reward coins and return the result message, or None if the series had already been resolved."""
+    user_id = game.user_id
     success_goals = random.randint(constants.PENALTY_MIN_GOALS, constants.PENALTY_MAX_GOALS)
     reward = success_goals * constants.PENALTY_GOAL_REWARD
-    await db.execute_update("UPDATE users SET Coins = Coins + ?, ReceivedCoins = ReceivedCoins + ? WHERE UserId = ?", (reward, reward, user_id))
-    left = user_data[PENALTY_LEFT] - 1
+    db = Database()
+    if not await db.complete_game(game.id, "UPDATE users SET Coins = Coins + ?, ReceivedCoins = ReceivedCoins + ? WHERE UserId = ?", (reward, reward, user_id), user_id=user_id, refresh_success=False):
+        return None
+    user_data = await db.get_user(user_id)
+    left = user_data.penalty_left if user_data else 0
     penalty_result_msg = await tr(user_id, 'messages.penalty_result')
-    result = penalty_result_msg.format(goals=success_goals, reward=reward, left=left)
-
-    return {"start_msg": match_started_msg, "result": result}
+    return penalty_result_msg.format(goals=success_goals, reward=reward, left=left)
 
 
-async def check_penalty_access(user_id: int) -> bool:
+async def check_penalty_access(user_id: int, user_data: UserRecord | None = None) -> bool:
     """Check if the user has enough success to access penalty mode."""
-    stats = await get_full_stats(user_id)
+    stats = await get_full_stats(user_id, user_data)
     return stats['success'] >= constants.PENALTY_SUCCESS_REQUIREMENT
+
+
+async def reset_penalty_attempts() -> None:
+    """Refill every user's penalty attempts to PENALTY_RESET_VALUE."""
+    await Database().reset_penalty_left(constants.PENALTY_RESET_VALUE)
+
+
+game_engine.register("penalty", resolve_penalty)
+job_scheduler.register("penalty_reset", PENALTY_RESET_SCHEDULE, reset_penalty_attempts)
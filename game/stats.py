@@ -1,12 +1,19 @@
 ﻿import game.constants as constants
-from utils.user_fields import *
+from db.records import UserRecord
 
 
-def calculate_success(user_data: tuple) -> int:
+def calculate_ghost_success(user_data: UserRecord) -> int:
+    """Calculate the success of ghost packs, i.e. packs issued by administrators that do not count."""
+    return (user_data.ghost_small_packs * constants.GHOST_SMALL_PACKS_COEFFICIENT +
+            user_data.ghost_medium_packs * constants.GHOST_MEDIUM_PACKS_COEFFICIENT +
+            user_data.ghost_big_packs * constants.GHOST_BIG_PACKS_COEFFICIENT)
+
+
+def calculate_success(user_data: UserRecord) -> int:
     """Calculate the user's success score based on victories, defeats, packs, and referrals, subtracting ghost success."""
-    victories, defeats = user_data[VICTORIES], user_data[DEFEATS]
-    small_packs, medium_packs, big_packs = user_data[SMALL_PACKS], user_data[MEDIUM_PACKS], user_data[BIG_PACKS]
-    referrals_count = user_data[REFERRALS_COUNT]
+    victories, defeats = user_data.victories, user_data.defeats
+    small_packs, medium_packs, big_packs = user_data.small_packs, user_data.medium_packs, user_data.big_packs
+    referrals_count = user_data.referrals_count
 
     skill = victories * constants.VICTORY_COEFFICIENT + defeats * constants.DEFEAT_COEFFICIENT
     resources = (small_packs * constants.SMALL_PACK_COEFFICIENT +
@@ -14,10 +21,7 @@ def calculate_success(user_data: tuple) -> int:
                  big_packs * constants.BIG_PACK_COEFFICIENT)
     bonus = referrals_count * constants.REFERRALS_COEFFICIENT
 
-    ghost_success = sum(user_data[i] * getattr(constants, f'GHOST_{["SMALL", "MEDIUM", "BIG"][i-GHOST_SMALL_PACKS]}_PACKS_COEFFICIENT')
-                       for i in range(GHOST_SMALL_PACKS, GHOST_BIG_PACKS + 1))
-
-    return skill + resources + bonus - ghost_success
+    return skill + resources + bonus - calculate_ghost_success(user_data)
 
 
 def calculate_win_rate(victories: int, games_played: int) -> float:
@@ -1,25 +1,57 @@
-﻿from aiogram.filters import CommandStart, Command
+﻿from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import CommandStart, Command
 from aiogram import F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 
 from os import getenv
 from db.database import Database
+from db.records import Broadcast, UserRecord
 from utils.logging import logger
-from utils.user import get_user, get_full_stats, change_user_lang, is_banned
+from utils.user import get_user, get_full_stats, change_user_lang, is_banned, ban_user, unban_user
 from utils.i18n import tr
 from utils.formatters import format_welcome_message, format_full_info_message
-from utils.auth import check_user
+from utils.auth import (check_user, is_admin, setup_throttling, setup_user_context, parse_ban_duration,
+                        ban_end_after)
+from utils.broadcast import broadcaster
 from utils.keyboards import (create_games_markup, create_play_button_markup,
                              create_lang_selection_markup, create_games_and_events_markup,
                              create_main_menu_markup)
 from handlers.registration import RegistrationStates, process_name
+from game.engine import game_engine
 from game.penalty import play_penalty, check_penalty_access
 from game.matches import play_match
-from utils.user_fields import REFERRALS_COUNT
 
 db = Database()
 
 
+class GameStartGuard:
+    """Per-user single-flight registry for game starts.
+
+    A user may only start a game while no other start of theirs is being processed and none of their
+    games is waiting for its result; duplicate taps are rejected and counted.
+    """
+
+    def __init__(self):
+        """Create an empty registry."""
+        self._in_flight: set[int] = set()
+        self.rejected = 0
+
+    def acquire(self, user_id: int) -> bool:
+        """Mark a game start as in flight, or count and reject it if the user is already playing."""
+        if user_id in self._in_flight or game_engine.has_pending(user_id):
+            self.rejected += 1
+            return False
+        self._in_flight.add(user_id)
+        return True
+
+    def release(self, user_id: int) -> None:
+        """Mark a game start as finished."""
+        self._in_flight.discard(user_id)
+
+
+game_guard = GameStartGuard()
+
+
 def checked_handler(dp, *filters):
     """Decorator to combine @check_user and register handlers for given filters (message or callback)."""
     def decorator(func):
@@ -36,9 +68,21 @@ def checked_handler(dp, *filters):
     return decorator
 
 
-async def send_welcome(message: Message):
-    """Handle the /start command by retrieving user data, formatting a welcome message with user info
-    and commands list, and sending it."""
+async def show_screen(callback: CallbackQuery, text: str, reply_markup: InlineKeyboardMarkup | None = None):
+    """Replace the message the callback came from with a new screen, sending a new message if that
+    message cannot be edited."""
+    try:
+        await callback.message.edit_text(text, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if "message is not modified" in str(e):
+            return
+        logger.debug(f"Could not edit message for user {callback.from_user.id}: {e}")
+        await callback.message.answer(text, reply_markup=reply_markup)
+
+
+async def send_welcome(message: Message, user_data: UserRecord):
+    """Handle the /start command by formatting a welcome message with the user's info and commands
+    list, and sending it."""
     user_id = message.from_user.id
     args = message.text.split()[1] if len(message.text.split()) > 1 else None
     if args and args.isdigit():
@@ -47,25 +91,25 @@ async def send_welcome(message: Message):
             # Check if referrer exists and not banned
             referrer_data = await get_user(referrer_id)
             if referrer_data and not await is_banned(referrer_id):
-                # Award referrer 40000 coins
-                await db.execute_update("UPDATE users SET Coins = Coins + 40000, ReceivedCoins = ReceivedCoins + 40000 WHERE UserId = ?", (referrer_id,))
-                # Increment referrals count
-                await db.execute_update("UPDATE users SET ReferralsCount = ReferralsCount + 1 WHERE UserId = ?", (referrer_id,))
+                # Award referrer 40000 coins and increment referrals count
+                await db.execute_update("UPDATE users SET Coins = Coins + 40000, ReceivedCoins = ReceivedCoins + 40000, "
+                                        "ReferralsCount = ReferralsCount + 1 WHERE UserId = ?", (referrer_id,),
+                                        user_id=referrer_id)
                 logger.info(f"Referred user {user_id} by {referrer_id}, awarded 40000 coins.")
     
     logger.debug(f"Handling /start command for user {user_id}.")
-    user_data = await get_user(user_id)
+    await db.unblock_user(user_id)
     logger.debug(f"Sending welcome message to user {user_id}.")
     text = await format_welcome_message(user_id, user_data)
     await message.answer(text, reply_markup=await create_main_menu_markup(user_id))
 
 
-async def send_full_info(update: Message | CallbackQuery):
-    """Handle the /full_info command or callback by retrieving user stats, formatting full info message,
+async def send_full_info(update: Message | CallbackQuery, user_data: UserRecord):
+    """Handle the /full_info command or callback by computing user stats, formatting full info message,
     and sending it, distinguishing between Message and CallbackQuery."""
     user_id = update.from_user.id
     logger.debug(f"Handling full_info for user {user_id}.")
-    stats = await get_full_stats(user_id)
+    stats = await get_full_stats(user_id, user_data)
     if stats is None:
         text = await tr(user_id, 'messages.user_not_found')
     else:
@@ -107,8 +151,8 @@ async def send_games_menu(update: Message | CallbackQuery):
     markup = await create_games_markup(user_id)
     title = await tr(user_id, 'messages.games')
     if isinstance(update, CallbackQuery):
-        await update.answer(title)
-        await update.message.answer(title, reply_markup=markup)
+        await update.answer()
+        await show_screen(update, title, markup)
     else:
         await update.answer(title, reply_markup=markup)
 
@@ -118,48 +162,55 @@ async def send_games_and_events_menu(callback: CallbackQuery):
     user_id = callback.from_user.id
     markup = await create_games_and_events_markup(user_id)
     title = await tr(user_id, 'messages.games_and_events')
-    await callback.answer(title)
-    await callback.message.answer(title, reply_markup=markup)
+    await callback.answer()
+    await show_screen(callback, title, markup)
 
 
-async def send_penalty_menu(callback: CallbackQuery):
+async def send_penalty_menu(callback: CallbackQuery, user_data: UserRecord):
     """Send penalty menu with access check, message and play button."""
     user_id = callback.from_user.id
-    if not await check_penalty_access(user_id):
+    if not await check_penalty_access(user_id, user_data):
         msg = await tr(user_id, 'messages.penalty_start')
         await callback.answer(msg, show_alert=True)
         return
     msg = await tr(user_id, 'messages.penalty')
-    await callback.answer(msg)
+    await callback.answer()
     markup = await create_play_button_markup(user_id, "play_penalty")
-    await callback.message.answer(msg, reply_markup=markup)
+    await show_screen(callback, msg, markup)
 
 
 async def send_matches_menu(callback: CallbackQuery):
     """Send matches menu with requirements and play button."""
     user_id = callback.from_user.id
     markup = await create_play_button_markup(user_id, "play_match")
-    await callback.answer(await tr(user_id, 'messages.matches'))
+    await callback.answer()
     req_msg = await tr(user_id, 'messages.match_requirements')
-    await callback.message.answer(req_msg, reply_markup=markup)
+    await show_screen(callback, req_msg, markup)
 
 
-async def play_game(callback: CallbackQuery, game_func):
-    """Play a game by calling game_func and sending start and result messages."""
+async def play_game(callback: CallbackQuery, game_func, user_data: UserRecord):
+    """Start a game by calling game_func and turning the play button's message into its start message;
+    the game engine edits the same message into the result when the game is due."""
     user_id = callback.from_user.id
-    game_data = await game_func(user_id)
+    if not game_guard.acquire(user_id):
+        logger.debug(f"Rejected duplicate game start for user {user_id}.")
+        await callback.answer(await tr(user_id, 'messages.game_in_progress'))
+        return
+    try:
+        game_data = await game_func(user_id, user_data, callback.message.chat.id, callback.message.message_id)
+    finally:
+        game_guard.release(user_id)
     if "error" in game_data:
-        await callback.message.answer(game_data["error"])
+        await callback.answer(game_data["error"], show_alert=True)
         return
-    await callback.message.answer(game_data["start_msg"])
-    await callback.message.answer(game_data["result"])
+    await callback.answer()
+    await show_screen(callback, game_data["start_msg"])
 
 
-async def send_referral_info(update: Message | CallbackQuery):
+async def send_referral_info(update: Message | CallbackQuery, user_data: UserRecord):
     """Send referral info with link and stats."""
     user_id = update.from_user.id
-    user_data = await get_user(user_id)
-    referrals_count = user_data[REFERRALS_COUNT]
+    referrals_count = user_data.referrals_count
     referral_link = f"https://t.me/{getenv('BOT_USERNAME')}?start={user_id}"
     text = await tr(user_id, 'messages.referral_info')
     text = text.format(link=referral_link, count=referrals_count)
@@ -170,84 +221,163 @@ async def send_referral_info(update: Message | CallbackQuery):
         await update.answer(text)
 
 
+async def send_broadcast(message: Message):
+    """Start broadcasting the message the admin replied to, or the text after the command, to every
+    user. Ignored for users who are not admins."""
+    user_id = message.from_user.id
+    if not is_admin(user_id):
+        logger.warning(f"User {user_id} tried to start a broadcast.")
+        return
+    text = message.text.partition(" ")[2].strip()
+    reply = message.reply_to_message
+    if reply is not None:
+        broadcast = Broadcast(admin_id=user_id, chat_id=message.chat.id, from_chat_id=reply.chat.id,
+                              message_id=reply.message_id)
+    elif text:
+        broadcast = Broadcast(admin_id=user_id, chat_id=message.chat.id, text=text)
+    else:
+        await message.answer(await tr(user_id, 'messages.broadcast_usage'))
+        return
+    if not await broadcaster.launch(broadcast):
+        await message.answer(await tr(user_id, 'messages.broadcast_failed'))
+        return
+    text = await tr(user_id, 'messages.broadcast_started')
+    await message.answer(text.format(id=broadcast.id))
+
+
+async def send_ban(message: Message):
+    """Ban the user whose ID follows the command, for the optional duration after it (30m, 12h, 7d) or
+    permanently. Ignored for users who are not admins."""
+    user_id = message.from_user.id
+    if not is_admin(user_id):
+        logger.warning(f"User {user_id} tried to ban a user.")
+        return
+    args = message.text.split()[1:]
+    duration = parse_ban_duration(args[1]) if len(args) == 2 else None
+    if not args or len(args) > 2 or not args[0].isdigit() or (len(args) == 2 and duration is None):
+        await message.answer(await tr(user_id, 'messages.ban_usage'))
+        return
+    target_id = int(args[0])
+    ban_end = ban_end_after(duration) if duration else None
+    if not await ban_user(target_id, ban_end):
+        text = await tr(user_id, 'messages.ban_user_not_found')
+        await message.answer(text.format(user_id=target_id))
+        return
+    text = await tr(user_id, 'messages.ban_done')
+    await message.answer(text.format(user_id=target_id, ban_date=ban_end or await tr(user_id, 'messages.ban_never')))
+
+
+async def send_unban(message: Message):
+    """Lift the ban of the user whose ID follows the command. Ignored for users who are not admins."""
+    user_id = message.from_user.id
+    if not is_admin(user_id):
+        logger.warning(f"User {user_id} tried to unban a user.")
+        return
+    args = message.text.split()[1:]
+    if len(args) != 1 or not args[0].isdigit():
+        await message.answer(await tr(user_id, 'messages.ban_usage'))
+        return
+    target_id = int(args[0])
+    key = 'messages.unban_done' if await unban_user(target_id) else 'messages.ban_user_not_found'
+    text = await tr(user_id, key)
+    await message.answer(text.format(user_id=target_id))
+
+
 def setup_handlers(dp):
     """Register all handlers with the dispatcher, including message and callback query handlers for
     commands and interactions."""
+    setup_throttling(dp)
+    setup_user_context(dp)
     dp.message.register(process_name, RegistrationStates.waiting_for_name)
 
     @checked_handler(dp, CommandStart())
-    async def start_handler(message: Message, state = None):
+    async def start_handler(message: Message, state = None, user = None):
         """Handle the /start command by sending a welcome message to the user."""
-        await send_welcome(message)
+        await send_welcome(message, user)
 
     @checked_handler(dp, Command("full_info"), F.data == "full_info")
-    async def full_info_handler(update: Message | CallbackQuery, state = None):
+    async def full_info_handler(update: Message | CallbackQuery, state = None, user = None):
         """Handle the /full_info command or full_info callback query by sending detailed user
         information."""
-        await send_full_info(update)
+        await send_full_info(update, user)
 
     @checked_handler(dp, Command("changelang"))
-    async def changelang_handler(message: Message, state = None):
+    async def changelang_handler(message: Message, state = None, user = None):
         """Handle the /changelang command by initiating the language change process."""
         await send_change_lang(message)
 
     @checked_handler(dp, Command("games"))
-    async def games_cmd_handler(message: Message, state = None):
+    async def games_cmd_handler(message: Message, state = None, user = None):
         """Handle /games command by creating games markup and sending games title."""
         await send_games_menu(message)
 
     @checked_handler(dp, Command("stats"))
-    async def stats_cmd_handler(message: Message, state = None):
+    async def stats_cmd_handler(message: Message, state = None, user = None):
         """Handle /stats command by sending full user info."""
-        await send_full_info(message)
+        await send_full_info(message, user)
 
     @checked_handler(dp, Command("referral"))
-    async def referral_cmd_handler(message: Message, state = None):
+    async def referral_cmd_handler(message: Message, state = None, user = None):
         """Handle /referral command by showing referral link and stats."""
-        await send_referral_info(message)
+        await send_referral_info(message, user)
+
+    @checked_handler(dp, Command("broadcast"))
+    async def broadcast_handler(message: Message, state = None, user = None):
+        """Handle the admin-only /broadcast command by starting a broadcast."""
+        await send_broadcast(message)
+
+    @checked_handler(dp, Command("ban"))
+    async def ban_handler(message: Message, state = None, user = None):
+        """Handle the admin-only /ban command by banning a user."""
+        await send_ban(message)
+
+    @checked_handler(dp, Command("unban"))
+    async def unban_handler(message: Message, state = None, user = None):
+        """Handle the admin-only /unban command by lifting a user's ban."""
+        await send_unban(message)
 
     @checked_handler(dp, F.data.startswith("lang:"))
-    async def lang_change_handler(callback: CallbackQuery, state = None):
+    async def lang_change_handler(callback: CallbackQuery, state = None, user = None):
         """Handle callback queries for language selection, updating the user's language preference."""
         await handle_lang_change(callback)
 
     @checked_handler(dp, F.data == "games_and_events")
-    async def games_and_events_handler(callback: CallbackQuery, state = None):
+    async def games_and_events_handler(callback: CallbackQuery, state = None, user = None):
         """Handle games_and_events callback by creating markup and sending title."""
         await send_games_and_events_menu(callback)
 
     @checked_handler(dp, F.data == "games")
-    async def games_handler(callback: CallbackQuery, state = None):
+    async def games_handler(callback: CallbackQuery, state = None, user = None):
         """Handle games callback by creating games markup and sending title."""
         await send_games_menu(callback)
 
     @checked_handler(dp, F.data == "penalty")
-    async def penalty_handler(callback: CallbackQuery, state = None):
+    async def penalty_handler(callback: CallbackQuery, state = None, user = None):
         """Handle penalty callback by checking access, sending penalty message and play button."""
-        await send_penalty_menu(callback)
+        await send_penalty_menu(callback, user)
 
     @checked_handler(dp, F.data == "play_penalty")
-    async def play_penalty_handler(callback: CallbackQuery, state = None):
-        """Handle play_penalty callback by simulating penalty and sending start and result messages."""
-        await play_game(callback, play_penalty)
+    async def play_penalty_handler(callback: CallbackQuery, state = None, user = None):
+        """Handle play_penalty callback by starting a penalty series and sending its start message."""
+        await play_game(callback, play_penalty, user)
 
     @checked_handler(dp, F.data == "matches")
-    async def matches_handler(callback: CallbackQuery, state = None):
+    async def matches_handler(callback: CallbackQuery, state = None, user = None):
         """Handle matches callback by creating play button markup and sending requirements."""
         await send_matches_menu(callback)
 
     @checked_handler(dp, F.data == "play_match")
-    async def play_match_handler(callback: CallbackQuery, state = None):
-        """Handle play_match callback by simulating match and sending start and result messages."""
-        await play_game(callback, play_match)
+    async def play_match_handler(callback: CallbackQuery, state = None, user = None):
+        """Handle play_match callback by starting a match and sending its start message."""
+        await play_game(callback, play_match, user)
 
     @checked_handler(dp, F.data == "referral")
-    async def referral_callback_handler(callback: CallbackQuery, state = None):
+    async def referral_callback_handler(callback: CallbackQuery, state = None, user = None):
         """Handle referral callback by showing referral link and stats."""
-        await send_referral_info(callback)
+        await send_referral_info(callback, user)
 
     @checked_handler(dp, F.data == "changelang")
-    async def changelang_callback_handler(callback: CallbackQuery, state = None):
+    async def changelang_callback_handler(callback: CallbackQuery, state = None, user = None):
         """Handle changelang callback by showing language selection."""
         if callback.message:
             await send_change_lang(callback.message)
@@ -10,20 +10,69 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.types import BotCommand
 
-from handlers.commands import setup_handlers
+from db.change_sync import user_changes_sync
+from db.database import Database
+from db.fsm_storage import SQLiteStorage
+from game.engine import game_engine
+from handlers.commands import game_guard, setup_handlers
 from utils.bootstrap_dir import bootstrap
-from utils.logging import logger
+from utils.auth import ban_scheduler
+from utils.broadcast import broadcaster
+from utils.i18n.watcher import locale_watcher
+from utils.lifecycle import in_flight, serve_until_signal
+from utils.logging import logger, setup_logging
+from utils.outbound import send_limiter
+from utils.scheduler import job_scheduler
+from utils.webhook import run_webhook
+from utils.workers import WORKERS, Shard, run_supervisor
 
 load_dotenv(dotenv_path=Path(__file__).parent / '.env')
 
-dp = Dispatcher()
-setup_handlers(dp)
+BOT_MODE = getenv("BOT_MODE", "polling")
+
+
+
+async def on_startup(bot: Bot, shard: Shard | None = None) -> None:
+    """Opens the shared database connections, resumes pending games and broadcasts and starts watching the locale files, other processes' user changes and ban ends and runs the scheduled jobs, starting with those missed while stopped, before updates are processed. A worker process only resumes the work of its shard's users."""
+    await Database().open(load_rank_index=shard is None or shard.count == 1)
+    await game_engine.start(bot, shard)
+    await broadcaster.start(bot, shard)
+    locale_watcher.start()
+    user_changes_sync.start()
+    ban_scheduler.start()
+    job_scheduler.start()
+
+
+async def on_shutdown() -> None:
+    """Waits up to SHUTDOWN_TIMEOUT for the updates being handled, then stops the job scheduler, the background watchers, the ban scheduler, broadcasts and the game engine, letting games being resolved finish, and flushes pending writes and closes the shared database connections. Games that are not due yet stay stored and are resumed on the next start."""
+    await in_flight.drain()
+    await job_scheduler.stop()
+    await ban_scheduler.stop()
+    await user_changes_sync.stop()
+    await locale_watcher.stop()
+    await broadcaster.stop()
+    await game_engine.stop()
+    await Database().close()
+    logger.info(f"Outbound request stats: {send_limiter.stats()}")
+    logger.info(f"Rejected duplicate game starts: {game_guard.rejected}")
+
+
+def create_dispatcher() -> Dispatcher:
+    """Builds the dispatcher with its FSM storage, middlewares, handlers and startup and shutdown hooks. Worker processes build their own."""
+    dp = Dispatcher(storage=SQLiteStorage())
+    dp.update.outer_middleware(in_flight)
+    setup_handlers(dp)
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return dp
 
 
 async def start_bot() -> None:
-    """Starts the bot by establishing a connection, verifying bot credentials, logging essential information, and initiating the polling loop for handling updates."""
+    """Starts the bot by establishing a connection, verifying bot credentials, logging essential information, and receiving updates by long polling or, with BOT_MODE=webhook, over a webhook. With WORKERS > 1 the updates are handled by that many worker processes. Runs until SIGINT or SIGTERM, then stops receiving updates and shuts down gracefully."""
     logger.info("Starting bot...")
+    dp = create_dispatcher()
     bot = Bot(token=getenv("BOT_TOKEN"), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot.session.middleware(send_limiter)
     
     # Set bot commands
     commands = [
@@ -47,18 +96,28 @@ async def start_bot() -> None:
         logger.info("Bot information:")
         logger.info(f"Username: @{bot_info.username}")
         logger.info(f"ID: {bot_info.id}")
-        await dp.start_polling(bot)
+        if WORKERS > 1:
+            await serve_until_signal(run_supervisor(dp, bot, BOT_MODE))
+        elif BOT_MODE == "webhook":
+            await serve_until_signal(run_webhook(dp, bot))
+        else:
+            await serve_until_signal(dp.start_polling(bot, handle_signals=False), dp.stop_polling)
 
 
 async def main() -> None:
-    """Serves as the main entry point of the application, executing bootstrap procedures for initial setup and subsequently starting the bot."""
+    """Serves as the main entry point of the application, executing bootstrap procedures for initial setup and subsequently starting the bot, and flushes the queued log records once it stops."""
+    setup_logging()
     await bootstrap()
-    await start_bot()
+    try:
+        await start_bot()
+    finally:
+        logger.info("Bot stopped.")
+        await logger.complete()
 
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        logger.info("Bot stopped by user.")
+        logger.info("Bot stopped by a second interrupt.")
         sys.exit(0)
\ No newline at end of file
@@ -1 +1,4 @@
-﻿from .decorators import *
+﻿from .admins import *
+from .bans import *
+from .decorators import *
+from .middlewares import *
@@ -0,0 +1,8 @@
+﻿from os import getenv
+
+ADMIN_IDS = frozenset(int(admin_id) for admin_id in getenv("ADMIN_IDS", "").replace(" ", "").split(",") if admin_id)
+
+
+def is_admin(user_id: int) -> bool:
+    """Whether the user is listed in the comma-separated ADMIN_IDS."""
+    return user_id in ADMIN_IDS
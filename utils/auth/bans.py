@@ -0,0 +1,74 @@
+﻿import asyncio
+import re
+import time
+from os import getenv
+
+from db.ban_index import format_ban_end
+from db.database import Database
+from utils.logging import logger
+
+BAN_CHECK_INTERVAL = float(getenv("BAN_CHECK_INTERVAL", "60"))
+
+_DURATION_UNITS = {"m": 60, "h": 3600, "d": 86400}
+_DURATION_PATTERN = re.compile(r"(\d+)([mhd])")
+
+
+def parse_ban_duration(text: str) -> float | None:
+    """Seconds in a ban duration such as 30m, 12h or 7d; None if text is not one."""
+    match = _DURATION_PATTERN.fullmatch(text.strip().lower())
+    if match is None or int(match.group(1)) == 0:
+        return None
+    return int(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+
+def ban_end_after(seconds: float) -> str:
+    """BanEnd value for a ban lasting seconds from now."""
+    return format_ban_end(time.time() + seconds)
+
+
+class BanScheduler:
+    """Lifts bans in the database once their BanEnd has passed.
+
+    Ban checks already treat such bans as lifted, so this only keeps Users in step; with the ban index
+    loaded, the database is only written to when the index holds an ended ban.
+    """
+
+    def __init__(self, interval: float = BAN_CHECK_INTERVAL):
+        """Create a stopped scheduler checking for expired bans every interval seconds."""
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the scheduler task is alive."""
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Start lifting expired bans."""
+        if self.interval > 0 and not self.is_running:
+            self._task = asyncio.create_task(self._run(), name="ban-scheduler")
+
+    async def stop(self) -> None:
+        """Stop lifting expired bans."""
+        if self.is_running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self) -> None:
+        """Lift the bans that have ended since the previous check."""
+        db = Database()
+        while True:
+            try:
+                user_ids = await db.lift_expired_bans()
+                if user_ids:
+                    logger.info(f"Lifted expired bans of {len(user_ids)} users.")
+            except Exception as e:
+                logger.error(f"Could not lift expired bans: {e}")
+            await asyncio.sleep(self.interval)
+
+
+ban_scheduler = BanScheduler()
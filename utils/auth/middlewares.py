@@ -0,0 +1,118 @@
+﻿import time
+from os import getenv
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, TelegramObject
+
+from utils.i18n import tr, update_user_lang_cache
+from utils.logging import logger
+from utils.outbound import TokenBucket
+from utils.user import get_ban_status, get_user
+
+THROTTLE_RATE = float(getenv("THROTTLE_RATE", "2"))
+THROTTLE_BURST = float(getenv("THROTTLE_BURST", "5"))
+THROTTLE_EVICT_INTERVAL = float(getenv("THROTTLE_EVICT_INTERVAL", "60"))
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Outer middleware dropping the updates of users sending more than THROTTLE_RATE per second.
+
+    Each user gets a token bucket allowing bursts of THROTTLE_BURST updates. Updates beyond that are
+    dropped before any database access; dropped callback queries are answered without text so the
+    client stops showing a spinner. Buckets that are full again are evicted every
+    THROTTLE_EVICT_INTERVAL seconds, so memory only grows with the users active in that time.
+    """
+
+    def __init__(self, rate: float = THROTTLE_RATE, burst: float = THROTTLE_BURST,
+                 evict_interval: float = THROTTLE_EVICT_INTERVAL):
+        """Create a middleware allowing rate updates per second per user with bursts of burst."""
+        self.rate = rate
+        self.burst = burst
+        self.evict_interval = evict_interval
+        self.dropped = 0
+        self._buckets: dict[int, TokenBucket] = {}
+        self._next_evict = time.monotonic() + evict_interval
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        if from_user is None:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        if now >= self._next_evict:
+            self._evict_idle(now)
+        bucket = self._buckets.get(from_user.id)
+        if bucket is None:
+            bucket = self._buckets[from_user.id] = TokenBucket(self.rate, self.burst, now)
+        if bucket.delay(now) > 0:
+            self.dropped += 1
+            logger.debug(f"Throttled an update of user {from_user.id}.")
+            if isinstance(event, CallbackQuery):
+                await event.answer()
+            return None
+        bucket.take(now)
+        return await handler(event, data)
+
+    def _evict_idle(self, now: float) -> None:
+        """Forget the buckets of users who have not sent anything for a while."""
+        self._buckets = {user_id: bucket for user_id, bucket in self._buckets.items() if not bucket.is_idle(now)}
+        self._next_evict = now + self.evict_interval
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """Outer middleware that loads the sender's Users row once per update.
+
+    Banned users are answered first, from the in-memory ban index, so no handler runs and no row is
+    loaded for them. For everyone else the row is injected into handler data as `user` (None for
+    unregistered users) and seeds the translation language cache.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        if from_user is None:
+            return await handler(event, data)
+
+        user_id = from_user.id
+        banned, ban_end = await get_ban_status(user_id)
+        if banned:
+            logger.warning(f"User {user_id} is banned, blocking access.")
+            ban_date = ban_end or await tr(user_id, 'messages.ban_never')
+            banned_msg = await tr(user_id, 'messages.banned')
+            banned_msg = banned_msg.format(ban_date=ban_date)
+            if isinstance(event, CallbackQuery):
+                await event.answer(banned_msg, show_alert=True)
+            else:
+                await event.answer(banned_msg)
+            return None
+
+        user = await get_user(user_id)
+        data["user"] = user
+        if user is not None:
+            update_user_lang_cache(user_id, user.lang)
+        return await handler(event, data)
+
+
+def setup_throttling(dp) -> None:
+    """Register ThrottlingMiddleware as an outer middleware for messages and callback queries; call it before
+    setup_user_context() so throttled updates never reach the database."""
+    middleware = ThrottlingMiddleware()
+    dp.message.outer_middleware(middleware)
+    dp.callback_query.outer_middleware(middleware)
+
+
+def setup_user_context(dp) -> None:
+    """Register UserContextMiddleware as an outer middleware for messages and callback queries."""
+    middleware = UserContextMiddleware()
+    dp.message.outer_middleware(middleware)
+    dp.callback_query.outer_middleware(middleware)
@@ -135,6 +135,22 @@ def check_and_get_db_info(db_path):
         msg = f"Error checking database structure: {e}"
         return [msg], msg
 
+def apply_schema(db_path):
+    """Creates tables and indexes from init.sql that are missing in an existing database (every statement
+    in init.sql is idempotent), returns list of error messages."""
+    if not db_path or not Path(db_path).exists():
+        return []
+    init_sql_path = Path(__file__).parent.parent.parent / "db" / "init.sql"
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            conn.executescript(init_sql_path.read_text(encoding='utf-8'))
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error) as e:
+        return [f"Unable to apply database schema: {e}"]
+    return []
+
 def check_database(db_path):
     """Checks if the SQLite database file exists, is accessible, and has the required tables and indexes as per 
     init.sql, returns list of error messages."""
@@ -151,12 +167,13 @@ async def bootstrap():
     read_dotenv()
 
     db_path = os.environ.get("DB_PATH")
+    schema_errors = await asyncio.to_thread(apply_schema, db_path)
     errors_lists = await asyncio.gather(
         asyncio.to_thread(check_packages, PKGS),
         asyncio.to_thread(check_env_vars, VARS),
         asyncio.to_thread(check_database, db_path)
     )
-    errors = [error for sublist in errors_lists for error in sublist]
+    errors = schema_errors + [error for sublist in errors_lists for error in sublist]
 
     if errors:
         error_msg = "Unable to start bot:\n" + "\n".join(errors)
@@ -0,0 +1 @@
+﻿from .broadcaster import *
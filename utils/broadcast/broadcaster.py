@@ -0,0 +1,133 @@
+﻿import asyncio
+from os import getenv
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError
+
+from db.database import Database
+from db.records import Broadcast
+from utils.i18n import tr
+from utils.logging import logger
+from utils.outbound import BULK, send_priority
+from utils.workers.sharding import Shard
+
+BROADCAST_CONCURRENCY = int(getenv("BROADCAST_CONCURRENCY", "8"))
+BROADCAST_CHECKPOINT_EVERY = int(getenv("BROADCAST_CHECKPOINT_EVERY", "100"))
+
+SENT = "sent"
+BLOCKED = "blocked"
+FAILED = "failed"
+
+
+class Broadcaster:
+    """Sends broadcasts to every user in the background.
+
+    Recipients are streamed from the database in UserId order, skipping users who blocked the bot, and
+    messaged in chunks of checkpoint_every by up to concurrency concurrent senders at bulk priority, so
+    the outbound rate limiter serves interactive replies first. Progress and newly blocked users are
+    saved after every chunk; broadcasts interrupted by a restart are resumed by start() after the last
+    saved chunk, so at most one chunk is delivered twice.
+    """
+
+    def __init__(self, concurrency: int = BROADCAST_CONCURRENCY, checkpoint_every: int = BROADCAST_CHECKPOINT_EVERY):
+        """Create a broadcaster without a bot; start() must be called before broadcasts are sent."""
+        self.concurrency = concurrency
+        self.checkpoint_every = checkpoint_every
+        self._bot: Bot | None = None
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    async def start(self, bot: Bot, shard: Shard | None = None) -> None:
+        """Resume every broadcast left running by a previous run, only those started by the shard's
+        admins if one is given."""
+        self._bot = bot
+        broadcasts = [broadcast for broadcast in await Database().get_running_broadcasts()
+                      if shard is None or shard.owns(broadcast.admin_id)]
+        for broadcast in broadcasts:
+            self._spawn(broadcast)
+        if broadcasts:
+            logger.info(f"Resumed {len(broadcasts)} broadcasts.")
+
+    async def stop(self) -> None:
+        """Interrupt the running broadcasts; they are resumed from their last checkpoint by the next start()."""
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    async def launch(self, broadcast: Broadcast) -> bool:
+        """Store a new broadcast and start sending it."""
+        if not await Database().create_broadcast(broadcast):
+            return False
+        self._spawn(broadcast)
+        logger.info(f"Admin {broadcast.admin_id} started broadcast {broadcast.id}.")
+        return True
+
+    def _spawn(self, broadcast: Broadcast) -> None:
+        """Run a broadcast in its own task."""
+        task = asyncio.create_task(self._run(broadcast), name=f"broadcast-{broadcast.id}")
+        self._tasks[broadcast.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast.id, None))
+
+    async def _deliver(self, broadcast: Broadcast, user_id: int) -> str:
+        """Send a broadcast to one user and classify the outcome."""
+        try:
+            if broadcast.message_id is not None:
+                await self._bot.copy_message(user_id, broadcast.from_chat_id, broadcast.message_id)
+            else:
+                await self._bot.send_message(user_id, broadcast.text)
+            return SENT
+        except TelegramForbiddenError:
+            return BLOCKED
+        except Exception as e:
+            logger.warning(f"Broadcast {broadcast.id} to user {user_id} failed: {e}")
+            return FAILED
+
+    async def _send_chunk(self, broadcast: Broadcast, user_ids: list[int]) -> None:
+        """Deliver a chunk of recipients and checkpoint it."""
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def deliver(user_id: int) -> str:
+            async with slots:
+                return await self._deliver(broadcast, user_id)
+
+        outcomes = await asyncio.gather(*(deliver(user_id) for user_id in user_ids))
+        blocked_ids = [user_id for user_id, outcome in zip(user_ids, outcomes) if outcome == BLOCKED]
+        broadcast.sent += outcomes.count(SENT)
+        broadcast.failed += outcomes.count(FAILED)
+        broadcast.blocked += len(blocked_ids)
+        broadcast.last_user_id = user_ids[-1]
+        await Database().save_broadcast_progress(broadcast, blocked_ids)
+
+    async def _run(self, broadcast: Broadcast) -> None:
+        """Send a broadcast to every remaining recipient and report the totals to its admin."""
+        send_priority.set(BULK)
+        db = Database()
+        try:
+            chunk: list[int] = []
+            async for user_id in db.iter_user_ids(after=broadcast.last_user_id, skip_blocked=True):
+                chunk.append(user_id)
+                if len(chunk) >= self.checkpoint_every:
+                    await self._send_chunk(broadcast, chunk)
+                    chunk = []
+            if chunk:
+                await self._send_chunk(broadcast, chunk)
+            broadcast.status = "done"
+            await db.save_broadcast_progress(broadcast, [])
+        except asyncio.CancelledError:
+            logger.info(f"Broadcast {broadcast.id} interrupted after user {broadcast.last_user_id}.")
+            raise
+        except Exception as e:
+            logger.error(f"Broadcast {broadcast.id} stopped after user {broadcast.last_user_id}: {e}")
+            return
+        logger.info(f"Broadcast {broadcast.id} finished: {broadcast.sent} sent, {broadcast.blocked} blocked, "
+                    f"{broadcast.failed} failed.")
+        try:
+            text = await tr(broadcast.admin_id, 'messages.broadcast_finished')
+            await self._bot.send_message(broadcast.chat_id, text.format(id=broadcast.id, sent=broadcast.sent,
+                                                                        blocked=broadcast.blocked,
+                                                                        failed=broadcast.failed))
+        except Exception as e:
+            logger.error(f"Could not report broadcast {broadcast.id} to admin {broadcast.admin_id}: {e}")
+
+
+broadcaster = Broadcaster()
@@ -1,47 +1,48 @@
 ﻿from db.database import Database
 
+from db.records import UserRecord
 from utils.i18n import tr
-from utils.user_fields import *
 
 db = Database()
 
 
-async def format_welcome_message(user_id: int, user_data: tuple) -> str:
+async def format_welcome_message(user_id: int, user_data: UserRecord) -> str:
     """Format the welcome message for a user using their data and translated text."""
     text = await tr(user_id, 'messages.welcome')
     return text.format(
-        user_id=user_data[USER_ID],
-        username=user_data[USERNAME],
-        coins=user_data[COINS],
-        tickets=user_data[TICKETS],
-        cups=user_data[CUPS],
-        user_info=user_data[USER_INFO]
+        user_id=user_data.user_id,
+        username=user_data.username,
+        coins=user_data.coins,
+        tickets=user_data.tickets,
+        cups=user_data.cups,
+        user_info=user_data.user_info
     )
 
 
 async def format_full_info_message(user_id: int, stats: dict) -> str:
     """Format the full info message for a user using their stats and translated text."""
     text = await tr(user_id, 'messages.full_info')
+    user_data = stats["user_data"]
     return text.format(
-        username=stats["user_data"][USERNAME],
-        coins=stats["user_data"][COINS],
-        tickets=stats["user_data"][TICKETS],
-        cups=stats["user_data"][CUPS],
-        received_coins=stats["user_data"][RECEIVED_COINS],
-        received_tickets=stats["user_data"][RECEIVED_TICKETS],
-        games_played=stats["user_data"][GAMES_PLAYED],
-        victories=stats["user_data"][VICTORIES],
+        username=user_data.username,
+        coins=user_data.coins,
+        tickets=user_data.tickets,
+        cups=user_data.cups,
+        received_coins=user_data.received_coins,
+        received_tickets=user_data.received_tickets,
+        games_played=user_data.games_played,
+        victories=user_data.victories,
         win_rate=stats['win_rate'],
-        defeats=stats["user_data"][DEFEATS],
-        draws=stats["user_data"][GAMES_PLAYED] - (stats["user_data"][VICTORIES] + stats["user_data"][DEFEATS]),
-        small_packs=stats["user_data"][SMALL_PACKS],
-        medium_packs=stats["user_data"][MEDIUM_PACKS],
-        big_packs=stats["user_data"][BIG_PACKS],
-        referrals=stats["user_data"][REFERRALS_COUNT],
-        register_date=stats["user_data"][REGISTER_DATE],
-        ghost_small=stats["user_data"][GHOST_SMALL_PACKS],
-        ghost_medium=stats["user_data"][GHOST_MEDIUM_PACKS],
-        ghost_big=stats["user_data"][GHOST_BIG_PACKS],
+        defeats=user_data.defeats,
+        draws=user_data.games_played - (user_data.victories + user_data.defeats),
+        small_packs=user_data.small_packs,
+        medium_packs=user_data.medium_packs,
+        big_packs=user_data.big_packs,
+        referrals=user_data.referrals_count,
+        register_date=user_data.register_date,
+        ghost_small=user_data.ghost_small_packs,
+        ghost_medium=user_data.ghost_medium_packs,
+        ghost_big=user_data.ghost_big_packs,
         ghost_success=stats['ghost_success'],
         success=stats['success'],
         position=stats['position'],
@@ -0,0 +1,46 @@
+﻿"""
+Locale startup benchmark
+----------------------------------
+Compares the ways the translation catalog can be built at startup:
+
+    python -m utils.i18n.benchmark [rounds]
+
+- pure-Python YAML parsing (yaml.SafeLoader) plus compilation, as before the cache existed;
+- C YAML parsing (yaml.CSafeLoader, if PyYAML was built with libyaml) plus compilation,
+  which is what a cache rebuild uses;
+- loading the compiled catalog from the binary cache.
+"""
+
+import sys
+import time
+
+import yaml
+
+from utils.i18n.localization import compile_catalog, load_catalog, load_locales
+
+
+def _measure(func, rounds: int) -> float:
+    """Return the best wall time of func() over rounds runs, in milliseconds."""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(rounds: int = 20) -> None:
+    """Run every variant and print the best time of each."""
+    load_catalog()  # make sure the cache exists and is fresh
+    results = {"yaml (SafeLoader) + compile": _measure(lambda: compile_catalog(load_locales(yaml.SafeLoader)), rounds)}
+    if hasattr(yaml, "CSafeLoader"):
+        results["yaml (CSafeLoader) + compile"] = _measure(lambda: compile_catalog(load_locales(yaml.CSafeLoader)),
+                                                          rounds)
+    results["binary cache"] = _measure(load_catalog, rounds)
+    baseline = next(iter(results.values()))
+    for name, ms in results.items():
+        print(f"{name:<30} {ms:8.2f} ms  x{baseline / ms:.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,66 @@
+﻿import hashlib
+import marshal
+import os
+from pathlib import Path
+from typing import Any
+
+from utils.logging import logger
+
+# Bump when the layout of the cached payload changes.
+CACHE_VERSION = 1
+
+
+def fingerprint(files: list[Path]) -> tuple:
+    """Identify the exact contents of a set of locale files by name, mtime, size and SHA-256.
+
+    Args:
+        files (list[Path]): The locale files.
+
+    Returns:
+        tuple: A marshal-friendly key that changes whenever any of the files changes.
+    """
+    key = []
+    for path in sorted(files):
+        stat = path.stat()
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        key.append((path.name, stat.st_mtime_ns, stat.st_size, digest))
+    return CACHE_VERSION, tuple(key)
+
+
+def read_cache(path: Path, key: tuple) -> Any | None:
+    """Load a cached payload if it was written for the same key.
+
+    Args:
+        path (Path): The cache file.
+        key (tuple): The fingerprint the payload must have been built from.
+
+    Returns:
+        Any | None: The payload, or None if the cache is missing, stale or unreadable.
+    """
+    try:
+        with open(path, 'rb') as f:
+            cached_key, payload = marshal.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable locale cache {path}: {e}")
+        return None
+    return payload if cached_key == key else None
+
+
+def write_cache(path: Path, key: tuple, payload: Any) -> None:
+    """Atomically store a payload together with the key it was built from.
+
+    Args:
+        path (Path): The cache file.
+        key (tuple): The fingerprint of the locale files.
+        payload (Any): Marshal-serializable compiled catalog.
+    """
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            marshal.dump((key, payload), f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"Could not write locale cache {path}: {e}")
+        tmp_path.unlink(missing_ok=True)
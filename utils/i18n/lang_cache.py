@@ -0,0 +1,54 @@
+﻿from collections import OrderedDict
+from os import getenv
+
+from db.change_sync import user_changes_sync
+
+LANG_CACHE_SIZE = int(getenv("LANG_CACHE_SIZE", "10000"))
+
+
+class LangCache:
+    """Bounded LRU cache of the users' language codes.
+
+    Only registered users are cached, so a user's language is read again once they register. A
+    generation counter prevents a read that raced with a change from storing the old language.
+    """
+
+    def __init__(self, max_size: int = LANG_CACHE_SIZE):
+        """Create an empty cache holding at most max_size languages."""
+        self.max_size = max_size
+        self.generation = 0
+        self._entries: OrderedDict[int, str] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: int) -> str | None:
+        """Return the cached language of a user, or None."""
+        lang = self._entries.get(user_id)
+        if lang is not None:
+            self._entries.move_to_end(user_id)
+        return lang
+
+    def put(self, user_id: int, lang: str, generation: int | None = None) -> None:
+        """Store a user's language; with a generation, only if nothing was invalidated since it was read."""
+        if self.max_size <= 0 or (generation is not None and generation != self.generation):
+            return
+        self._entries[user_id] = lang
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        """Forget a single user's language."""
+        self.generation += 1
+        self._entries.pop(user_id, None)
+
+
+def _invalidate_changed(user_ids: list[int]) -> None:
+    """Forget the languages of users changed by other bot processes."""
+    for user_id in user_ids:
+        lang_cache.invalidate(user_id)
+
+
+lang_cache = LangCache()
+user_changes_sync.subscribe(_invalidate_changed)
@@ -1,53 +1,267 @@
-﻿import yaml
+﻿import asyncio
+import os
+import yaml
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Any
+from string import Formatter
+from typing import Any, Callable, Dict
 
 from db.database import Database
 
+from utils.i18n.catalog_cache import fingerprint, read_cache, write_cache
+from utils.i18n.lang_cache import lang_cache
 from utils.logging import logger
 
 db = Database()
 
 LOC_DIR = Path(__file__).parent.parent.parent / "loc"
-locales: Dict[str, Dict[str, Any]] = {}
+LOC_CACHE_PATH = Path(os.getenv("LOC_CACHE_PATH", LOC_DIR / ".catalog.cache"))
+FALLBACK_LANG = 'en_US'
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
-for loc_file in LOC_DIR.glob("*.yaml"):
-    lang_code = loc_file.stem
+
+def _flatten(data: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """Flatten nested locale sections into a dict keyed by dotted paths.
+
+    Args:
+        data (Dict[str, Any]): A (sub)tree of a parsed locale file.
+        prefix (str): The dotted path of data inside the locale.
+
+    Returns:
+        Dict[str, Any]: Leaf values (strings or lists) keyed by their full dotted path.
+    """
+    flat = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{path}."))
+        else:
+            flat[path] = value
+    return flat
+
+
+def _placeholders(value: Any) -> frozenset[str]:
+    """Parse the names of the format fields used by a template.
+
+    Args:
+        value (Any): A translation value; strings have placeholders, and a list has those of its items.
+
+    Returns:
+        frozenset[str]: The field names, e.g. {'score1', 'score2'} for "{score1}:{score2}".
+    """
+    if isinstance(value, list):
+        return frozenset().union(*(_placeholders(item) for item in value))
+    if not isinstance(value, str):
+        return frozenset()
     try:
-        with open(loc_file, encoding='utf-8') as f:
-            locales[lang_code] = yaml.safe_load(f)
-        logger.debug(f"Loaded localization for {lang_code}")
+        return frozenset(field.split('.')[0].split('[')[0]
+                         for _, field, _, _ in Formatter().parse(value) if field)
+    except ValueError:
+        return frozenset()
+
+
+def compile_catalog(raw: Dict[str, Dict[str, Any]]) -> tuple[Dict[tuple[str, str], Any], Dict[str, list[str]]]:
+    """Compile parsed locales into a flat (lang, key) -> value table with en_US fallbacks merged in.
+
+    Args:
+        raw (Dict[str, Dict[str, Any]]): Parsed locale files keyed by language code.
+
+    Returns:
+        tuple: The flat table and a validation report listing, per language, keys missing from it
+        (served from en_US), keys whose value is of another type than in en_US (e.g. a string instead
+        of a list) and keys whose placeholders differ from en_US.
+    """
+    flat = {lang: _flatten(data or {}) for lang, data in raw.items()}
+    fallback = flat.get(FALLBACK_LANG, {})
+    table: Dict[tuple[str, str], Any] = {}
+    report: Dict[str, list[str]] = {}
+    for lang, values in flat.items():
+        problems = []
+        for key, value in fallback.items():
+            if key not in values:
+                problems.append(f"missing '{key}'")
+                table[(lang, key)] = value
+            elif type(values[key]) is not type(value):
+                problems.append(f"'{key}' is not a {type(value).__name__} as in {FALLBACK_LANG}")
+            elif _placeholders(values[key]) != _placeholders(value):
+                problems.append(f"placeholders of '{key}' differ from {FALLBACK_LANG}")
+        for key, value in values.items():
+            table[(lang, key)] = value
+        if problems:
+            report[lang] = problems
+    return table, report
+
+
+def locale_files() -> list[Path]:
+    """Return the locale files in the loc directory."""
+    return list(LOC_DIR.glob("*.yaml"))
+
+
+def load_locales(loader: type = YamlLoader, strict: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Parse every locale file in the loc directory, using the C YAML loader when available.
+
+    Args:
+        loader (type): The YAML loader class.
+        strict (bool): Raise on the first file that cannot be parsed instead of skipping it.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Parsed locale files keyed by language code.
+
+    Raises:
+        ValueError: In strict mode, if a file cannot be parsed or is not a mapping.
+    """
+    raw: Dict[str, Dict[str, Any]] = {}
+    for loc_file in locale_files():
+        lang_code = loc_file.stem
+        try:
+            with open(loc_file, encoding='utf-8') as f:
+                data = yaml.load(f, Loader=loader)
+            if strict and not isinstance(data, dict):
+                raise ValueError("the file is not a mapping")
+            raw[lang_code] = data
+            logger.debug(f"Loaded localization for {lang_code}")
+        except Exception as e:
+            if strict:
+                raise ValueError(f"Failed to load localization for {lang_code}: {e}") from e
+            logger.error(f"Failed to load localization for {lang_code}: {e}")
+    return raw
+
+
+@dataclass(frozen=True, slots=True)
+class Catalog:
+    """A compiled set of locales. It is replaced as a whole on reload and never modified in place."""
+    key: tuple
+    locales: Dict[str, Dict[str, Any]]
+    translations: Dict[tuple[str, str], Any]
+    report: Dict[str, list[str]]
+
+
+def load_catalog(use_cache: bool = True, strict: bool = False) -> Catalog:
+    """Load the compiled catalog from the binary cache, rebuilding it from the YAML files if they changed.
+
+    Args:
+        use_cache (bool): Whether to read and write the cache file at LOC_CACHE_PATH.
+        strict (bool): Raise instead of skipping broken files, and require the fallback locale.
+
+    Returns:
+        Catalog: The parsed locales, the flat translation table and the validation report.
+
+    Raises:
+        ValueError: In strict mode, if a locale file is broken or the fallback locale is missing.
+    """
+    key = fingerprint(locale_files())
+    if use_cache:
+        cached = read_cache(LOC_CACHE_PATH, key)
+        if cached is not None:
+            logger.debug("Loaded localizations from cache.")
+            return Catalog(key, *cached)
+    raw = load_locales(strict=strict)
+    if strict and FALLBACK_LANG not in raw:
+        raise ValueError(f"Fallback localization {FALLBACK_LANG} is missing")
+    table, report = compile_catalog(raw)
+    if use_cache:
+        write_cache(LOC_CACHE_PATH, key, (raw, table, report))
+    return Catalog(key, raw, table, report)
+
+
+def _log_catalog(catalog: Catalog) -> None:
+    """Log how many localizations a catalog holds and the problems found while compiling it."""
+    loaded_count = len(catalog.locales)
+    logger.info(f"Loaded {loaded_count} localizations.")
+    if loaded_count == 0:
+        logger.warning("No localizations were loaded. Check the loc directory.")
+    for report_lang, problems in catalog.report.items():
+        logger.warning(f"Localization {report_lang} has {len(problems)} problems: {'; '.join(problems)}")
+
+
+_catalog = load_catalog()
+_log_catalog(_catalog)
+_reload_callbacks: list[Callable[[Catalog], None]] = []
+
+
+def get_catalog() -> Catalog:
+    """Return the catalog currently in use. Keep the returned reference for lookups that must agree."""
+    return _catalog
+
+
+def get_locales() -> Dict[str, Dict[str, Any]]:
+    """Return the parsed locale files currently in use, keyed by language code."""
+    return _catalog.locales
+
+
+def on_locales_reload(callback: Callable[[Catalog], None]) -> None:
+    """Register a function called with the new catalog after every successful reload."""
+    _reload_callbacks.append(callback)
+
+
+async def reload_locales() -> bool:
+    """Rebuild the catalog from the locale files in a worker thread and swap it in.
+
+    The new catalog replaces the current one with a single assignment, so a lookup sees either the
+    old or the new version. If any file fails to parse, the current catalog is kept.
+
+    Returns:
+        bool: Whether the new catalog was installed.
+    """
+    global _catalog
+    try:
+        catalog = await asyncio.to_thread(load_catalog, True, True)
     except Exception as e:
-        logger.error(f"Failed to load localization for {lang_code}: {e}")
+        logger.error(f"Locale reload failed, keeping the previous localizations: {e}")
+        return False
+    _catalog = catalog
+    _log_catalog(catalog)
+    for callback in _reload_callbacks:
+        try:
+            callback(catalog)
+        except Exception as e:
+            logger.error(f"Locale reload callback {callback!r} failed: {e}")
+    return True
+
+
+def _get_value(lang: str, key: str) -> Any:
+    """Look up a compiled translation, whose en_US fallback was already merged at load time.
 
-loaded_count = len(locales)
-logger.info(f"Loaded {loaded_count} localizations.")
-if loaded_count == 0:
-    logger.warning("No localizations were loaded. Check the loc directory.")
+    Args:
+        lang (str): The language code; unknown languages fall back to en_US.
+        key (str): The dotted translation key.
 
-user_lang_cache: Dict[int, str] = {}
+    Returns:
+        Any: The translated value or the key itself if no locale defines it.
+    """
+    catalog = _catalog
+    if lang not in catalog.locales:
+        lang = FALLBACK_LANG
+    value = catalog.translations.get((lang, key))
+    if value is None:
+        logger.warning(f"Translation key '{key}' not found for lang '{lang}'")
+        return key
+    return value
 
 
-def _get_value(lang: str, keys: list[str]) -> str:
-    """Retrieve a nested value from locales with fallback to en_US.
+async def resolve_user_lang(user_id: int) -> str:
+    """Returns the user's preferred language from cache or database, with fallback to English.
 
     Args:
-        lang (str): The language code.
-        keys (list[str]): The list of keys representing the nested structure.
+        user_id (int): The ID of the user.
 
     Returns:
-        str: The translated value or the key path if not found.
+        str: A language code present in the current catalog.
     """
-    for l in [lang, 'en_US']:
-        value = locales.get(l, {})
+    lang = lang_cache.get(user_id)
+    if lang is None:
+        generation = lang_cache.generation
         try:
-            for k in keys:
-                value = value[k]
-            return value
-        except KeyError:
-            continue
-    logger.warning(f"Translation key '{'.'.join(keys)}' not found for lang '{lang}'")
-    return '.'.join(keys)
+            lang = await db.get_user_lang(user_id)
+        except Exception as e:
+            logger.error(f"Error getting user lang for {user_id}: {e}")
+            lang = None
+        if lang is None:
+            # Not registered (yet): answer in English without caching it.
+            return FALLBACK_LANG
+        lang_cache.put(user_id, lang, generation)
+
+    return lang if lang in _catalog.locales else FALLBACK_LANG
 
 
 async def tr(user_id: int, key: str) -> str:
@@ -61,23 +275,7 @@ async def tr(user_id: int, key: str) -> str:
     Returns:
         str: The translated string.
     """
-    if user_id not in user_lang_cache:
-        try:
-            user = await db.get_user(user_id)
-            lang = user[30] if user and len(user) > 30 else 'en_US'
-            user_lang_cache[user_id] = lang
-        except Exception as e:
-            logger.error(f"Error getting user lang for {user_id}: {e}")
-            lang = 'en_US'
-            user_lang_cache[user_id] = lang
-    else:
-        lang = user_lang_cache[user_id]
-
-    if lang not in locales:
-        lang = 'en_US'
-
-    keys = key.split('.')
-    return _get_value(lang, keys)
+    return _get_value(await resolve_user_lang(user_id), key)
 
 
 def update_user_lang_cache(user_id: int, lang: str):
@@ -87,7 +285,7 @@ def update_user_lang_cache(user_id: int, lang: str):
         user_id (int): The ID of the user.
         lang (str): The new language code.
     """
-    user_lang_cache[user_id] = lang
+    lang_cache.put(user_id, lang)
 
 
 def get_translation(lang: str, key: str) -> str:
@@ -101,11 +299,7 @@ def get_translation(lang: str, key: str) -> str:
     Returns:
         str: The translated string.
     """
-    if lang not in locales:
-        lang = 'en_US'
-
-    keys = key.split('.')
-    return _get_value(lang, keys)
+    return _get_value(lang, key)
 
 
 def get_loss_reasons(user_id: int) -> list[str]:
@@ -117,7 +311,4 @@ def get_loss_reasons(user_id: int) -> list[str]:
     Returns:
         list[str]: The list of loss reasons in the user's language.
     """
-    lang = user_lang_cache.get(user_id, 'en_US')
-    if lang not in locales:
-        lang = 'en_US'
-    return locales[lang]['messages']['loss_reasons']
+    return _get_value(lang_cache.get(user_id) or FALLBACK_LANG, 'messages.loss_reasons')
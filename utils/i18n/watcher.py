@@ -0,0 +1,60 @@
+﻿import asyncio
+from os import getenv
+
+from utils.i18n.catalog_cache import fingerprint
+from utils.i18n.localization import get_catalog, locale_files, reload_locales
+from utils.logging import logger
+
+LOC_RELOAD_INTERVAL = float(getenv("LOC_RELOAD_INTERVAL", "5"))
+
+
+class LocaleWatcher:
+    """Polls the locale files and reloads the catalog when their contents change.
+
+    The files are fingerprinted in a worker thread, so polling never blocks the event loop. A change
+    that fails to load is not retried until the files change again.
+    """
+
+    def __init__(self, interval: float = LOC_RELOAD_INTERVAL):
+        """Create a stopped watcher polling every interval seconds; 0 disables it."""
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the polling task is alive."""
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Start polling the locale files."""
+        if self.interval > 0 and not self.is_running:
+            self._task = asyncio.create_task(self._run(), name="locale-watcher")
+
+    async def stop(self) -> None:
+        """Stop polling."""
+        if self.is_running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self) -> None:
+        """Reload the catalog whenever the fingerprint of the locale files changes."""
+        seen = get_catalog().key
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                key = await asyncio.to_thread(lambda: fingerprint(locale_files()))
+            except Exception as e:
+                logger.error(f"Could not check the locale files: {e}")
+                continue
+            if key == seen:
+                continue
+            seen = key
+            logger.info("Locale files changed, reloading localizations.")
+            await reload_locales()
+
+
+locale_watcher = LocaleWatcher()
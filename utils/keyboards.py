@@ -1,54 +1,92 @@
-﻿from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+﻿from typing import Callable
 
-from utils.i18n import tr, locales
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+from utils.i18n import get_locales, get_translation, on_locales_reload, resolve_user_lang
 
-async def create_games_markup(user_id: int) -> InlineKeyboardMarkup:
-    """Create inline keyboard for games selection with translated buttons."""
-    penalty_text = await tr(user_id, 'messages.penalty')
-    matches_text = await tr(user_id, 'messages.matches')
+# (lang, menu) -> markup; menus only depend on the language, so each one is built once per locale.
+_markups: dict[tuple[str, str], InlineKeyboardMarkup] = {}
+
+
+def _cached_markup(lang: str, menu: str, build: Callable[[str], InlineKeyboardMarkup]) -> InlineKeyboardMarkup:
+    """Return the markup of a menu in a language, building it on first use."""
+    markup = _markups.get((lang, menu))
+    if markup is None:
+        markup = _markups[(lang, menu)] = build(lang)
+    return markup
+
+
+def clear_markup_cache(*_) -> None:
+    """Drop every prebuilt markup, e.g. after the localizations were reloaded."""
+    _markups.clear()
+
+
+on_locales_reload(clear_markup_cache)
+
+
+def _build_games_markup(lang: str) -> InlineKeyboardMarkup:
+    """Build the games selection in a language."""
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=penalty_text, callback_data='penalty')],
-        [InlineKeyboardButton(text=matches_text, callback_data='matches')]
+        [InlineKeyboardButton(text=get_translation(lang, 'messages.penalty'), callback_data='penalty')],
+        [InlineKeyboardButton(text=get_translation(lang, 'messages.matches'), callback_data='matches')]
     ])
 
 
-async def create_play_button_markup(user_id: int, callback_data: str) -> InlineKeyboardMarkup:
-    """Create inline keyboard with play button using translated text."""
-    play_text = await tr(user_id, 'messages.play_button')
+def _build_play_button_markup(lang: str, callback_data: str) -> InlineKeyboardMarkup:
+    """Build the play button in a language."""
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=play_text, callback_data=callback_data)]
+        [InlineKeyboardButton(text=get_translation(lang, 'messages.play_button'), callback_data=callback_data)]
     ])
 
 
-def create_lang_selection_markup() -> InlineKeyboardMarkup:
-    """Create inline keyboard for language selection using available locales."""
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+def _build_games_and_events_markup(lang: str) -> InlineKeyboardMarkup:
+    """Build the games and events selection in a language."""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=get_translation(lang, 'messages.games'), callback_data='games')],
+        [InlineKeyboardButton(text=get_translation(lang, 'messages.events'), callback_data='events')]
+    ])
+
+
+def _build_main_menu_markup(lang: str) -> InlineKeyboardMarkup:
+    """Build the main menu in a language."""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=get_translation(lang, 'messages.games'), callback_data='games')],
+        [InlineKeyboardButton(text=get_translation(lang, 'messages.stats'), callback_data='full_info')],
+        [InlineKeyboardButton(text=get_translation(lang, 'messages.referral'), callback_data='referral')],
+        [InlineKeyboardButton(text=get_translation(lang, 'messages.changelang'), callback_data='changelang')]
+    ])
+
+
+def _build_lang_selection_markup(_lang: str) -> InlineKeyboardMarkup:
+    """Build the language selection, which is the same in every language."""
+    locales = get_locales()
+    return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=f"{locales[lang]['config']['loc_flag']} {locales[lang]['config']['loc_name']}", callback_data=f"lang:{lang}")]
         for lang in locales
     ])
-    return keyboard
+
+
+async def create_games_markup(user_id: int) -> InlineKeyboardMarkup:
+    """Create inline keyboard for games selection with translated buttons."""
+    return _cached_markup(await resolve_user_lang(user_id), 'games', _build_games_markup)
+
+
+async def create_play_button_markup(user_id: int, callback_data: str) -> InlineKeyboardMarkup:
+    """Create inline keyboard with play button using translated text."""
+    return _cached_markup(await resolve_user_lang(user_id), f'play:{callback_data}',
+                          lambda lang: _build_play_button_markup(lang, callback_data))
+
+
+def create_lang_selection_markup() -> InlineKeyboardMarkup:
+    """Create inline keyboard for language selection using available locales."""
+    return _cached_markup('', 'lang_selection', _build_lang_selection_markup)
 
 
 async def create_games_and_events_markup(user_id: int) -> InlineKeyboardMarkup:
     """Create inline keyboard for games and events selection with translated buttons."""
-    games_text = await tr(user_id, 'messages.games')
-    events_text = await tr(user_id, 'messages.events')
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=games_text, callback_data='games')],
-        [InlineKeyboardButton(text=events_text, callback_data='events')]
-    ])
+    return _cached_markup(await resolve_user_lang(user_id), 'games_and_events', _build_games_and_events_markup)
 
 
 async def create_main_menu_markup(user_id: int) -> InlineKeyboardMarkup:
     """Create inline keyboard for main menu navigation with translated buttons."""
-    games_text = await tr(user_id, 'messages.games')
-    stats_text = await tr(user_id, 'messages.stats')
-    referral_text = await tr(user_id, 'messages.referral')
-    changelang_text = await tr(user_id, 'messages.changelang')
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=games_text, callback_data='games')],
-        [InlineKeyboardButton(text=stats_text, callback_data='full_info')],
-        [InlineKeyboardButton(text=referral_text, callback_data='referral')],
-        [InlineKeyboardButton(text=changelang_text, callback_data='changelang')]
-    ])
+    return _cached_markup(await resolve_user_lang(user_id), 'main_menu', _build_main_menu_markup)
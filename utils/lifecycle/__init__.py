@@ -0,0 +1 @@
+﻿from .shutdown import *
@@ -0,0 +1,105 @@
+﻿import asyncio
+import signal
+from contextlib import suppress
+from os import getenv
+from typing import Any, Awaitable, Callable, Coroutine
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from utils.logging import logger
+
+SHUTDOWN_TIMEOUT = float(getenv("SHUTDOWN_TIMEOUT", "30"))
+
+
+class InFlightUpdates(BaseMiddleware):
+    """Outer update middleware counting the updates being handled, so shutdown can wait for them.
+
+    Once drain() is called, updates that still arrive are dropped instead of being handled.
+    """
+
+    def __init__(self):
+        """Create a tracker that accepts updates and has none in flight."""
+        self.accepting = True
+        self._count = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def count(self) -> int:
+        """Number of updates being handled."""
+        return self._count
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if not self.accepting:
+            logger.debug("Dropped an update received during shutdown.")
+            return None
+        self._count += 1
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self._count -= 1
+            if self._count == 0:
+                self._idle.set()
+
+    async def drain(self, timeout: float = SHUTDOWN_TIMEOUT) -> bool:
+        """Stop accepting updates and wait up to timeout seconds for those in flight.
+
+        Returns whether every update finished in time.
+        """
+        self.accepting = False
+        if self._count:
+            logger.info(f"Waiting for {self._count} updates in flight...")
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except TimeoutError:
+            logger.warning(f"Shutting down with {self._count} updates still in flight.")
+            return False
+        return True
+
+
+async def serve_until_signal(serve: Coroutine, stop: Callable[[], Awaitable] | None = None) -> None:
+    """Run serve until it returns or SIGINT or SIGTERM is received, then stop it gracefully.
+
+    On a signal serve is stopped by awaiting stop() or, without stop, by cancelling it, and is waited for
+    so its cleanup runs. The handlers are removed once the first signal arrives, so a second one
+    terminates the process immediately.
+    """
+    loop = asyncio.get_running_loop()
+    received = asyncio.Event()
+
+    def on_signal(sig: signal.Signals) -> None:
+        logger.info(f"Received {sig.name}, shutting down...")
+        received.set()
+
+    signals = (signal.SIGINT, signal.SIGTERM)
+    for sig in signals:
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, on_signal, sig)
+    task = asyncio.create_task(serve)
+    waiter = asyncio.create_task(received.wait())
+    try:
+        await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        waiter.cancel()
+        for sig in signals:
+            with suppress(NotImplementedError):
+                loop.remove_signal_handler(sig)
+    if not task.done():
+        if stop is not None:
+            await stop()
+        else:
+            task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    else:
+        task.result()
+
+
+in_flight = InFlightUpdates()
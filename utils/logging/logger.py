@@ -57,17 +57,25 @@ logger.add(
     level=LOG_LEVEL,
 )
 
+def worker_log_path(process_name: str) -> Path:
+    """Returns the log file of a worker process, next to the main log file."""
+    return LOGS_DIR_PATH / f"{LOG_FILE_PATH.stem}.{process_name}{LOG_FILE_PATH.suffix}"
+
 def _archive_previous_log():
-    """Archives the previous log file if it exists and has content."""
-    if LOG_FILE_PATH.exists() and LOG_FILE_PATH.stat().st_size > 0:
+    """Archives the previous log files of the main process and its workers if they have content."""
+    paths = [LOG_FILE_PATH, *LOGS_DIR_PATH.glob(f"{LOG_FILE_PATH.stem}.*{LOG_FILE_PATH.suffix}")]
+    paths = [path for path in paths if path.is_file() and path.stat().st_size > 0]
+    if paths:
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         base_name = LOG_FILE_PATH.stem
         archive_name = f"{base_name}_{ts}.zip"
         archive_path = ARCHIVE_DIR_PATH / archive_name
         try:
             with zipfile.ZipFile(archive_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-                zf.write(LOG_FILE_PATH, arcname=LOG_FILE_PATH.name)
-            LOG_FILE_PATH.unlink()
+                for path in paths:
+                    zf.write(path, arcname=path.name)
+            for path in paths:
+                path.unlink()
         except Exception as e:
             logger.opt(depth=1).error(f"Failed to archive previous log: {e}")
 
@@ -89,18 +97,27 @@ def _cleanup_old_archives():
     except Exception:
         pass
 
-_archive_previous_log()
-_cleanup_old_archives()
-
-LOG_FILE_PATH.touch()
-
-logger.add(
-    str(LOG_FILE_PATH),
-    format="{time:YYYY-MM-DD HH:mm:ss} {level: <8} {module: <15}:{function: <25} │ {message}",
-    colorize=False,
-    level="DEBUG",
-    enqueue=True,
-)
+def setup_logging(process_name: str | None = None):
+    """Adds the log file sink; until then records only go to stderr.
+
+    The main process (without process_name) first archives the previous run's log files and removes expired
+    archives, so it must be the only process doing so. A worker process appends to a file of its own named
+    after process_name, which the next run of the main process archives.
+    """
+    if process_name is None:
+        _archive_previous_log()
+        _cleanup_old_archives()
+        path = LOG_FILE_PATH
+    else:
+        path = worker_log_path(process_name)
+    path.touch()
+    logger.add(
+        str(path),
+        format="{time:YYYY-MM-DD HH:mm:ss} {level: <8} {module: <15}:{function: <25} │ {message}",
+        colorize=False,
+        level="DEBUG",
+        enqueue=True,
+    )
 
 def critical(message: Any):
     """Logs a critical message."""
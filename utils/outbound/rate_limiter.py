@@ -0,0 +1,254 @@
+﻿import asyncio
+import heapq
+import itertools
+import time
+from contextvars import ContextVar
+from os import getenv
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+
+from utils.logging import logger
+
+SEND_GLOBAL_RATE = float(getenv("SEND_GLOBAL_RATE", "30"))
+SEND_GLOBAL_BURST = float(getenv("SEND_GLOBAL_BURST", "30"))
+SEND_CHAT_RATE = float(getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = float(getenv("SEND_CHAT_BURST", "3"))
+SEND_MAX_RETRIES = int(getenv("SEND_MAX_RETRIES", "3"))
+# Idle chat buckets are dropped once there are more than this many.
+SEND_MAX_CHAT_BUCKETS = int(getenv("SEND_MAX_CHAT_BUCKETS", "10000"))
+
+INTERACTIVE = 0
+BULK = 1
+
+# Priority of the requests made by the current task; bulk senders such as broadcasts set it to BULK.
+send_priority: ContextVar[int] = ContextVar("send_priority", default=INTERACTIVE)
+
+
+class TokenBucket:
+    """Allows rate requests per second on average with bursts of up to capacity."""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float | None = None):
+        """Create a full bucket; now is the monotonic time the caller goes on to use it with."""
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available, 0 if one is available now."""
+        self._refill(now)
+        wait = max(0.0, self.updated - now)
+        return wait if self.tokens >= 1 else wait + (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        """Consume a token; delay() must have returned 0."""
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for the next seconds, then a single one."""
+        self.tokens = 1
+        self.updated = time.monotonic() + seconds
+
+    def is_idle(self, now: float) -> bool:
+        """Whether the bucket is full again, i.e. forgetting it changes nothing."""
+        self._refill(now)
+        return now >= self.updated and self.tokens >= self.capacity
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "future", "enqueued_at")
+
+    def __init__(self, priority: int, seq: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class SendRateLimiter(BaseRequestMiddleware):
+    """Bot session middleware keeping requests to chats within Telegram's flood limits.
+
+    Every request addressed to a chat takes a token from a global bucket and from that chat's bucket.
+    Requests that cannot go out immediately wait in a queue served by a single task, interactive ones
+    before bulk ones and otherwise in arrival order; a waiting request only holds back requests to the
+    same chat. Waiting requests are kept in a heap per chat; chats whose bucket has a token are kept in
+    a heap by their best request and the others in a heap by the time their bucket refills, so a grant
+    does not scan every waiting request. A request failing with TelegramRetryAfter pauses its chat for retry_after seconds and
+    is queued again, up to max_retries times.
+    """
+
+    def __init__(self, global_rate: float = SEND_GLOBAL_RATE, global_burst: float = SEND_GLOBAL_BURST,
+                 chat_rate: float = SEND_CHAT_RATE, chat_burst: float = SEND_CHAT_BURST,
+                 max_retries: int = SEND_MAX_RETRIES):
+        """Create a limiter; the queue task starts with the first request that has to wait."""
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats: dict[int | str, TokenBucket] = {}
+        self._queues: dict[int | str, list[_Waiter]] = {}
+        self._ready: list[tuple[int, int, int | str]] = []
+        self._sleeping: list[tuple[float, int, int | str]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.sent = 0
+        self.delayed = 0
+        self.retries = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def depth(self) -> int:
+        """Number of requests waiting for a token."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self) -> dict:
+        """Queue depth, wait time and retry counters."""
+        return {
+            "depth": self.depth,
+            "sent": self.sent,
+            "delayed": self.delayed,
+            "retries": self.retries,
+            "total_wait": self.total_wait,
+            "avg_wait": self.total_wait / self.delayed if self.delayed else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+    def set_global_limit(self, rate: float, burst: float) -> None:
+        """Change the global limit, e.g. to one worker's share of it."""
+        self._global = TokenBucket(rate, burst)
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot,
+                       method: TelegramMethod) -> Response:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, send_priority.get())
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                logger.warning(f"Flood control in chat {chat_id}, retrying in {e.retry_after}s.")
+                self._bucket(chat_id).pause(e.retry_after)
+
+    def _bucket(self, chat_id: int | str, now: float | None = None) -> TokenBucket:
+        """Return the bucket of a chat, creating it as of now if needed."""
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= SEND_MAX_CHAT_BUCKETS:
+                self._evict_idle()
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    def _evict_idle(self) -> None:
+        """Forget the buckets of chats that are full again and have no request waiting."""
+        now = time.monotonic()
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items()
+                        if chat_id not in self._queues and bucket.is_idle(now)]:
+            del self._chats[chat_id]
+
+    async def _acquire(self, chat_id: int | str, priority: int) -> None:
+        """Wait until a request to a chat may be sent."""
+        now = time.monotonic()
+        bucket = self._bucket(chat_id, now)
+        if not self._queues and self._global.delay(now) == 0 and bucket.delay(now) == 0:
+            self._global.take(now)
+            bucket.take(now)
+            self.sent += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(priority, next(self._seq), future)
+        queue = self._queues.setdefault(chat_id, [])
+        heapq.heappush(queue, waiter)
+        if queue[0] is waiter:
+            self._schedule(chat_id, now)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="send-rate-limiter")
+        self._wakeup.set()
+        await future
+
+    def _schedule(self, chat_id: int | str, now: float) -> None:
+        """Queue a chat with waiting requests for its next grant: as ready if its bucket has a token,
+        otherwise asleep until it has one. Entries made stale by later changes are skipped when popped."""
+        delay = self._bucket(chat_id, now).delay(now)
+        if delay > 0:
+            heapq.heappush(self._sleeping, (now + delay, next(self._seq), chat_id))
+        else:
+            head = self._queues[chat_id][0]
+            heapq.heappush(self._ready, (head.priority, head.seq, chat_id))
+
+    def _pop_ready(self, now: float) -> _Waiter | None:
+        """Take a chat token for the best waiting request of a ready chat and return it, or None if no chat is ready."""
+        while self._ready:
+            _, seq, chat_id = heapq.heappop(self._ready)
+            queue = self._queues.get(chat_id)
+            if not queue:
+                continue
+            while queue and queue[0].future.done():
+                heapq.heappop(queue)
+            if not queue:
+                del self._queues[chat_id]
+                continue
+            bucket = self._bucket(chat_id, now)
+            if queue[0].seq != seq or bucket.delay(now) > 0:
+                self._schedule(chat_id, now)
+                continue
+            waiter = heapq.heappop(queue)
+            bucket.take(now)
+            if queue:
+                self._schedule(chat_id, now)
+            else:
+                del self._queues[chat_id]
+            return waiter
+        return None
+
+    async def _run(self) -> None:
+        """Grant tokens to waiting requests, best priority first, until the queue is empty."""
+        while self._queues:
+            now = time.monotonic()
+            global_delay = self._global.delay(now)
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+                continue
+            woken = []
+            while self._sleeping and self._sleeping[0][0] <= now:
+                woken.append(heapq.heappop(self._sleeping)[2])
+            for chat_id in woken:
+                if chat_id in self._queues:
+                    self._schedule(chat_id, now)
+            waiter = self._pop_ready(now)
+            if waiter is None:
+                if not self._queues:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._sleeping[0][0] - now if self._sleeping else None)
+                except TimeoutError:
+                    pass
+                continue
+            self._global.take(now)
+            waited = now - waiter.enqueued_at
+            self.sent += 1
+            self.delayed += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            waiter.future.set_result(None)
+
+send_limiter = SendRateLimiter()
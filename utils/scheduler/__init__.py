@@ -0,0 +1,2 @@
+﻿from .jobs import *
+from .timer_wheel import *
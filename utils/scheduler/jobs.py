@@ -0,0 +1,97 @@
+﻿import asyncio
+import time
+from dataclasses import dataclass
+from os import getenv
+from typing import Any, Awaitable, Callable
+
+from db.database import Database
+from utils.logging import logger
+
+JOB_CHECK_INTERVAL = float(getenv("JOB_CHECK_INTERVAL", "60"))
+
+# Named schedules accepted by JobScheduler.register(), in seconds.
+SCHEDULES = {"hourly": 3600, "daily": 86400}
+
+
+@dataclass(frozen=True, slots=True)
+class Job:
+    """A coroutine function run once per period of period seconds, counted from the Unix epoch (UTC)."""
+    name: str
+    period: float
+    func: Callable[[], Awaitable[Any]]
+
+    def period_start(self, now: float) -> float:
+        """Start of the period containing now."""
+        return now - now % self.period
+
+
+class JobScheduler:
+    """Runs registered jobs once per period, e.g. daily at 00:00 UTC.
+
+    The last run of every job is stored in JobRuns, so a job whose run was missed while the bot was down
+    runs as soon as the scheduler starts. Every run is claimed in the database before it starts, so a job
+    runs once per period even when several bot processes run the scheduler; a failed run releases its
+    claim and is retried at the next check.
+    """
+
+    def __init__(self, check_interval: float = JOB_CHECK_INTERVAL):
+        """Create a stopped scheduler without jobs, checking for due jobs every check_interval seconds."""
+        self.check_interval = check_interval
+        self._jobs: dict[str, Job] = {}
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the scheduler task is alive."""
+        return self._task is not None and not self._task.done()
+
+    def register(self, name: str, schedule: str | float, func: Callable[[], Awaitable[Any]]) -> None:
+        """Run func once per schedule, a name from SCHEDULES or a period in seconds."""
+        if isinstance(schedule, str) and schedule not in SCHEDULES:
+            raise ValueError(f"Unknown schedule {schedule!r} for job {name}, expected one of {', '.join(SCHEDULES)}")
+        period = SCHEDULES[schedule] if isinstance(schedule, str) else schedule
+        self._jobs[name] = Job(name, period, func)
+
+    def start(self) -> None:
+        """Start running due jobs, beginning with those missed while stopped."""
+        if self._jobs and not self.is_running:
+            self._task = asyncio.create_task(self._run(), name="job-scheduler")
+
+    async def stop(self) -> None:
+        """Stop the scheduler, interrupting a job that is running; it runs again after the next start()."""
+        if self.is_running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self) -> None:
+        """Run the due jobs one after another every check_interval seconds."""
+        while True:
+            for job in list(self._jobs.values()):
+                await self._run_if_due(job)
+            await asyncio.sleep(self.check_interval)
+
+    @staticmethod
+    async def _run_if_due(job: Job) -> None:
+        """Claim and run a job if it has not run in the current period yet."""
+        db = Database()
+        if not await db.claim_job_run(job.name, job.period_start(time.time())):
+            return
+        logger.info(f"Running job {job.name}.")
+        started = time.monotonic()
+        try:
+            await job.func()
+        except asyncio.CancelledError:
+            await db.release_job_run(job.name)
+            raise
+        except Exception as e:
+            logger.error(f"Job {job.name} failed: {e}")
+            await db.release_job_run(job.name)
+        else:
+            logger.info(f"Job {job.name} finished in {time.monotonic() - started:.1f}s.")
+
+
+job_scheduler = JobScheduler()
@@ -0,0 +1,109 @@
+﻿import asyncio
+import math
+import time
+from os import getenv
+from typing import Awaitable, Callable
+
+from utils.logging import logger
+
+TICK_SECONDS = float(getenv("TIMER_WHEEL_TICK", "0.25"))
+WHEEL_SIZE = int(getenv("TIMER_WHEEL_SIZE", "512"))
+
+
+class Timer:
+    """Handle of a callback scheduled on a TimerWheel."""
+    __slots__ = ("rounds", "callback", "cancelled")
+
+    def __init__(self, rounds: int, callback: Callable[[], Awaitable]):
+        self.rounds = rounds
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """Prevent the callback from firing."""
+        self.cancelled = True
+
+
+class TimerWheel:
+    """Hashed timing wheel driven by a single asyncio task.
+
+    Scheduling and cancelling are O(1) and each tick only touches one slot, so thousands of pending
+    timers cost a list entry each instead of a sleeping task. Callbacks fire with a precision of one
+    tick, each in its own task.
+    """
+
+    def __init__(self, tick: float = TICK_SECONDS, size: int = WHEEL_SIZE):
+        """Create a stopped wheel with size slots of tick seconds each."""
+        self.tick = tick
+        self.size = size
+        self._slots: list[list[Timer]] = [[] for _ in range(size)]
+        self._cursor = 0
+        self._task: asyncio.Task | None = None
+        self._running: set[asyncio.Task] = set()
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the wheel task is alive."""
+        return self._task is not None and not self._task.done()
+
+    def __len__(self) -> int:
+        return sum(1 for slot in self._slots for timer in slot if not timer.cancelled)
+
+    def schedule(self, delay: float, callback: Callable[[], Awaitable]) -> Timer:
+        """Run callback() after delay seconds (at least one tick)."""
+        ticks = max(1, math.ceil(delay / self.tick))
+        timer = Timer((ticks - 1) // self.size, callback)
+        self._slots[(self._cursor + ticks) % self.size].append(timer)
+        return timer
+
+    def start(self) -> None:
+        """Start turning the wheel."""
+        if not self.is_running:
+            self._task = asyncio.create_task(self._run(), name="timer-wheel")
+
+    async def stop(self) -> None:
+        """Stop turning the wheel and wait for callbacks that already fired. Pending timers are kept."""
+        if self.is_running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def _fire(self, timer: Timer) -> None:
+        """Run a due timer's callback in its own task."""
+        task = asyncio.create_task(self._call(timer))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    @staticmethod
+    async def _call(timer: Timer) -> None:
+        """Await a timer callback, logging instead of propagating its errors."""
+        try:
+            await timer.callback()
+        except Exception as e:
+            logger.error(f"Timer callback failed: {e}")
+
+    async def _run(self) -> None:
+        """Advance one slot per tick and fire the timers whose last round has come."""
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.tick
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            self._cursor = (self._cursor + 1) % self.size
+            slot = self._slots[self._cursor]
+            if not slot:
+                continue
+            remaining = []
+            for timer in slot:
+                if timer.cancelled:
+                    continue
+                if timer.rounds > 0:
+                    timer.rounds -= 1
+                    remaining.append(timer)
+                else:
+                    self._fire(timer)
+            self._slots[self._cursor] = remaining
@@ -1,15 +1,14 @@
 ﻿import asyncio
 from db.database import Database
 
-import game.constants as constants
-from game.stats import calculate_success, calculate_win_rate
+from db.records import UserRecord
+from game.stats import calculate_ghost_success, calculate_success, calculate_win_rate
 from utils.logging import logger
-from utils.user_fields import *
 
 db = Database()
 
 
-async def get_user(user_id: int) -> tuple | None:
+async def get_user(user_id: int) -> UserRecord | None:
     """Retrieve user data from the database by user ID, logging the process."""
     logger.debug(f"Fetching user data for user_id {user_id}.")
     user = await db.get_user(user_id)
@@ -21,40 +20,59 @@ async def get_user(user_id: int) -> tuple | None:
 
 
 async def is_banned(user_id: int) -> bool:
-    """Check if a user is banned by querying the database."""
+    """Check if a user is banned, from the in-memory ban index once it is loaded."""
     logger.debug(f"Checking ban status for user_id {user_id}.")
     return await db.is_banned(user_id)
 
 
 async def get_ban_date(user_id: int) -> str | None:
-    """Retrieve the ban end date for a user from the database."""
+    """Retrieve the ban end date of a banned user, None for permanent bans and users who are not banned."""
     logger.debug(f"Fetching ban date for user_id {user_id}.")
     return await db.get_ban_date(user_id)
 
 
+async def get_ban_status(user_id: int) -> tuple[bool, str | None]:
+    """Check if a user is banned and until when (None for permanent bans) with a single lookup."""
+    logger.debug(f"Fetching ban status for user_id {user_id}.")
+    return await db.get_ban_status(user_id) or (False, None)
+
+
+async def ban_user(user_id: int, ban_end: str | None = None) -> bool:
+    """Ban a user until ban_end, or permanently without it; False if the user does not exist."""
+    logger.info(f"Banning user_id {user_id} until {ban_end or 'forever'}.")
+    return await db.ban_user(user_id, ban_end)
+
+
+async def unban_user(user_id: int) -> bool:
+    """Lift a user's ban; False if the user does not exist."""
+    logger.info(f"Unbanning user_id {user_id}.")
+    return await db.unban_user(user_id)
+
+
 async def create_user(user_id: int, name: str, lang: str) -> None:
-    """Create a new user in the database with the provided name and language."""
+    """Create a new user in the database with the provided name and language and cache the language."""
     logger.debug(f"Creating new user for user_id {user_id}.")
     await db.create_user(user_id, name, lang)
+    from utils.i18n import update_user_lang_cache
+    update_user_lang_cache(user_id, lang)
 
 
-async def get_full_stats(user_id: int) -> dict | None:
+async def get_full_stats(user_id: int, user_data: UserRecord | None = None) -> dict | None:
     """Calculate and return comprehensive user statistics including win rate, success, and position by
-    gathering data from database and computing values."""
+    gathering data from database and computing values. An already loaded user row can be passed in to
+    skip fetching it again."""
     logger.debug(f"Fetching full stats for user_id {user_id}.")
-    user_data, position = await asyncio.gather(db.get_user(user_id), db.get_user_position(user_id))
+    if user_data is None:
+        user_data, position = await asyncio.gather(db.get_user(user_id), db.get_user_position(user_id))
+    else:
+        position = await db.get_user_position(user_id)
     if user_data is None:
         logger.warning(f"User data not found for user_id {user_id} in get_full_stats.")
         return None
 
-    wins = user_data[VICTORIES]
-    total_matches = user_data[GAMES_PLAYED]
-    win_rate = calculate_win_rate(wins, total_matches)
-
+    win_rate = calculate_win_rate(user_data.victories, user_data.games_played)
     success = calculate_success(user_data)
-
-    ghost_success = sum(user_data[i] * getattr(constants, f'GHOST_{["SMALL", "MEDIUM", "BIG"][i-GHOST_SMALL_PACKS]}_PACKS_COEFFICIENT')
-                       for i in range(GHOST_SMALL_PACKS, GHOST_BIG_PACKS + 1))
+    ghost_success = calculate_ghost_success(user_data)
 
     logger.debug(f"Calculated stats for user_id {user_id}: success={success}, position={position}.")
     return {
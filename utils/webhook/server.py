@@ -0,0 +1,95 @@
+﻿import asyncio
+import secrets
+from os import getenv
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from utils.logging import logger
+
+WEBHOOK_URL = getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = getenv("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_CONCURRENCY = int(getenv("WEBHOOK_MAX_CONCURRENCY", "64"))
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """Webhook handler processing at most max_concurrency updates at a time.
+
+    Updates are handled before the response is sent, so once every slot is busy further requests wait
+    for one to free up and Telegram, which keeps at most max_connections requests open, slows down
+    instead of the bot queueing an unbounded number of tasks.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: str, max_concurrency: int, **data):
+        """Create a handler for one bot that only accepts requests carrying secret_token."""
+        super().__init__(dispatcher, bot, handle_in_background=False, secret_token=secret_token, **data)
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Reject requests without the secret token, then handle the update once a slot is free."""
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), self.bot):
+            logger.warning(f"Rejected webhook request from {request.remote} with a wrong secret token.")
+            return web.Response(body="Unauthorized", status=401)
+        async with self._slots:
+            return await super().handle(request)
+
+
+def add_webhook_registration(app: web.Application, dp: Dispatcher, bot: Bot, secret: str) -> None:
+    """Delete and register the webhook for WEBHOOK_URL + WEBHOOK_PATH when app starts, and delete it when
+    app shuts down. Without WEBHOOK_URL nothing is registered."""
+    url = f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}"
+
+    async def register_webhook(_: web.Application) -> None:
+        await bot.delete_webhook()
+        if not WEBHOOK_URL:
+            logger.warning("WEBHOOK_URL is not set, the webhook was not registered.")
+            return
+        await bot.set_webhook(url, secret_token=secret, allowed_updates=dp.resolve_used_update_types(),
+                              max_connections=min(WEBHOOK_MAX_CONCURRENCY, 100))
+        logger.info(f"Webhook registered at {url}.")
+
+    async def deregister_webhook(_: web.Application) -> None:
+        if WEBHOOK_URL:
+            await bot.delete_webhook()
+            logger.info("Webhook deleted.")
+
+    app.on_startup.append(register_webhook)
+    app.on_shutdown.append(deregister_webhook)
+
+
+async def serve_app(app: web.Application) -> None:
+    """Serve app on WEBHOOK_HOST:WEBHOOK_PORT until cancelled."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Listening for webhook updates on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}.")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """Serve updates over a webhook until cancelled, then close the bot session.
+
+    The webhook is deleted and registered again for WEBHOOK_URL + WEBHOOK_PATH on startup and deleted
+    on shutdown. Without WEBHOOK_URL nothing is registered, which allows testing locally by POSTing
+    recorded updates, e.g.:
+
+        curl -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" -H "Content-Type: application/json" \\
+             -d @update.json http://localhost:8080/webhook
+    """
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    app = web.Application()
+    BoundedRequestHandler(dp, bot, secret, WEBHOOK_MAX_CONCURRENCY).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    add_webhook_registration(app, dp, bot, secret)
+    try:
+        await serve_app(app)
+    finally:
+        await bot.session.close()
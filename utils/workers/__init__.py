@@ -0,0 +1,2 @@
+﻿from .sharding import *
+from .supervisor import *
@@ -0,0 +1,26 @@
+﻿from dataclasses import dataclass
+
+
+def shard_index(user_id: int, count: int) -> int:
+    """Index of the worker, out of count, that handles a user."""
+    return user_id % count
+
+
+def update_user_id(update: dict) -> int:
+    """ID of the user a raw update comes from, or of its chat if it has no user, or 0."""
+    for key, value in update.items():
+        if key != "update_id" and isinstance(value, dict):
+            sender = value.get("from") or value.get("user") or value.get("chat") or {}
+            return sender.get("id", 0)
+    return 0
+
+
+@dataclass(frozen=True, slots=True)
+class Shard:
+    """One of count worker processes, handling the users for whom shard_index() returns index."""
+    index: int
+    count: int
+
+    def owns(self, user_id: int) -> bool:
+        """Whether updates and background work of the user belong to this worker."""
+        return shard_index(user_id, self.count) == self.index
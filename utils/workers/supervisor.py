@@ -0,0 +1,193 @@
+﻿import asyncio
+import multiprocessing
+import queue
+import secrets
+import time
+from os import getenv
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+from utils.logging import logger
+from utils.webhook.server import WEBHOOK_PATH, WEBHOOK_SECRET, add_webhook_registration, serve_app
+from utils.workers.sharding import shard_index, update_user_id
+from utils.workers.worker import run_worker
+
+WORKERS = int(getenv("WORKERS", "1"))
+WORKER_QUEUE_SIZE = int(getenv("WORKER_QUEUE_SIZE", "1000"))
+SUPERVISOR_METRICS_INTERVAL = float(getenv("SUPERVISOR_METRICS_INTERVAL", "60"))
+WORKER_STOP_TIMEOUT = float(getenv("WORKER_STOP_TIMEOUT", "60"))
+
+
+def combine_metrics(snapshots: list[dict]) -> dict:
+    """Add up the counters of several workers' snapshots; max_* values take the maximum and the
+    cache hit rate and average send wait are recomputed from the totals."""
+    def merge(into: dict, snapshot: dict) -> None:
+        for key, value in snapshot.items():
+            if key in ("worker", "pid"):
+                continue
+            if isinstance(value, dict):
+                merge(into.setdefault(key, {}), value)
+            elif key.startswith("max_"):
+                into[key] = max(into.get(key, 0), value)
+            else:
+                into[key] = into.get(key, 0) + value
+
+    def recompute(metrics: dict) -> None:
+        for value in metrics.values():
+            if isinstance(value, dict):
+                recompute(value)
+        if "hits" in metrics and "misses" in metrics:
+            total = metrics["hits"] + metrics["misses"]
+            metrics["hit_rate"] = metrics["hits"] / total if total else 0.0
+        if "total_wait" in metrics and "delayed" in metrics:
+            metrics["avg_wait"] = metrics["total_wait"] / metrics["delayed"] if metrics["delayed"] else 0.0
+
+    combined: dict = {}
+    for snapshot in snapshots:
+        merge(combined, snapshot)
+    recompute(combined)
+    return combined
+
+
+class Supervisor:
+    """Runs the bot in count worker processes and routes every update to one of them.
+
+    Updates are routed by shard_index() of their user, so all updates of a user are handled by the same
+    worker, in order; per-user state such as caches and game start guards stays in one process. Each
+    worker has a bounded queue; when it is full, receiving updates waits. Workers that exit are
+    restarted with a new queue: a worker killed while waiting for an update keeps its queue's reader lock
+    forever, so the updates it was handling and those still queued for it are lost.
+    """
+
+    def __init__(self, count: int = WORKERS):
+        """Create a supervisor for count workers; start() launches them."""
+        self.count = count
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [self._context.Queue(WORKER_QUEUE_SIZE) for _ in range(count)]
+        self._metrics = self._context.Queue()
+        self._processes: list[multiprocessing.Process | None] = [None] * count
+        self._snapshots: dict[int, dict] = {}
+        self._stopping = False
+        self.routed = 0
+        self.restarts = 0
+
+    def metrics(self) -> dict:
+        """Combined counters of the workers' latest snapshots plus the supervisor's own."""
+        combined = combine_metrics(list(self._snapshots.values()))
+        combined.update(workers=self.count, routed=self.routed, restarts=self.restarts,
+                        queued=sum(q.qsize() for q in self._queues))
+        return combined
+
+    def start(self) -> None:
+        """Launch every worker process."""
+        for index in range(self.count):
+            self._spawn(index)
+        logger.info(f"Supervisor started {self.count} workers.")
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(target=run_worker, name=f"worker-{index}",
+                                        args=(index, self.count, self._queues[index], self._metrics))
+        process.start()
+        self._processes[index] = process
+
+    async def route(self, update: dict) -> None:
+        """Queue a raw update for the worker of its user, waiting while that worker's queue is full."""
+        worker_queue = self._queues[shard_index(update_user_id(update), self.count)]
+        try:
+            worker_queue.put_nowait(update)
+        except queue.Full:
+            await asyncio.to_thread(worker_queue.put, update)
+        self.routed += 1
+
+    async def supervise(self) -> None:
+        """Restart exited workers, collect their metrics and log the combined metrics periodically."""
+        next_report = time.monotonic() + SUPERVISOR_METRICS_INTERVAL
+        while True:
+            await asyncio.sleep(1)
+            self._collect()
+            for index, process in enumerate(self._processes):
+                if not self._stopping and process is not None and not process.is_alive():
+                    logger.error(f"Worker {index} exited with code {process.exitcode} with "
+                                 f"{self._queues[index].qsize()} updates queued, restarting it.")
+                    self.restarts += 1
+                    self._queues[index] = self._context.Queue(WORKER_QUEUE_SIZE)
+                    self._spawn(index)
+            if time.monotonic() >= next_report:
+                next_report += SUPERVISOR_METRICS_INTERVAL
+                logger.info(f"Worker metrics: {self.metrics()}")
+
+    def _collect(self) -> None:
+        """Keep the latest snapshot sent by each worker."""
+        while True:
+            try:
+                snapshot = self._metrics.get_nowait()
+            except queue.Empty:
+                return
+            self._snapshots[snapshot["worker"]] = snapshot
+
+    async def stop(self, timeout: float = WORKER_STOP_TIMEOUT) -> None:
+        """Ask every worker to finish its queue and stop, killing those still running after timeout; workers
+        ignore SIGTERM."""
+        self._stopping = True
+        for worker_queue in self._queues:
+            await asyncio.to_thread(worker_queue.put, None)
+        deadline = time.monotonic() + timeout
+        for index, process in enumerate(self._processes):
+            await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.error(f"Worker {index} did not stop in time, killing it.")
+                process.kill()
+        self._collect()
+        logger.info(f"Supervisor stopped. Worker metrics: {self.metrics()}")
+
+
+async def _poll(supervisor: Supervisor, dp: Dispatcher, bot: Bot) -> None:
+    """Receive updates by long polling and route them to the workers."""
+    await bot.delete_webhook()
+    allowed_updates = dp.resolve_used_update_types()
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+        except Exception as e:
+            logger.error(f"Failed to get updates: {e}")
+            await asyncio.sleep(5)
+            continue
+        for update in updates:
+            await supervisor.route(update.model_dump(mode="json", by_alias=True, exclude_unset=True))
+            offset = update.update_id + 1
+
+
+async def _serve_webhook(supervisor: Supervisor, dp: Dispatcher, bot: Bot) -> None:
+    """Receive updates over the webhook and route them to the workers without parsing them."""
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+
+    async def handle(request: web.Request) -> web.Response:
+        if not secrets.compare_digest(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), secret):
+            logger.warning(f"Rejected webhook request from {request.remote} with a wrong secret token.")
+            return web.Response(body="Unauthorized", status=401)
+        await supervisor.route(await request.json())
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    add_webhook_registration(app, dp, bot, secret)
+    await serve_app(app)
+
+
+async def run_supervisor(dp: Dispatcher, bot: Bot, mode: str, count: int = WORKERS) -> None:
+    """Run count workers and feed them the updates received by polling or, in webhook mode, over the
+    webhook, until cancelled."""
+    supervisor = Supervisor(count)
+    supervisor.start()
+    monitor = asyncio.create_task(supervisor.supervise())
+    try:
+        if mode == "webhook":
+            await _serve_webhook(supervisor, dp, bot)
+        else:
+            await _poll(supervisor, dp, bot)
+    finally:
+        monitor.cancel()
+        await supervisor.stop()
+        await bot.session.close()
@@ -0,0 +1,117 @@
+﻿import asyncio
+import os
+import signal
+from multiprocessing.queues import Queue
+from os import getenv
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+
+from db.database import Database
+from utils.logging import logger, setup_logging
+from utils.outbound import SEND_GLOBAL_BURST, SEND_GLOBAL_RATE, send_limiter
+from utils.workers.sharding import Shard, update_user_id
+
+WORKER_MAX_CONCURRENCY = int(getenv("WORKER_MAX_CONCURRENCY", "64"))
+WORKER_METRICS_INTERVAL = float(getenv("WORKER_METRICS_INTERVAL", "10"))
+
+
+class Worker:
+    """Handles the updates routed to one worker process by the supervisor.
+
+    Updates of different users are handled concurrently, up to WORKER_MAX_CONCURRENCY at a time, while
+    the updates of one user are handled one after another in the order they arrived.
+    """
+
+    def __init__(self, shard: Shard, updates: Queue, metrics: Queue):
+        """Create a worker reading raw updates from updates and reporting to metrics."""
+        self.shard = shard
+        self.updates = updates
+        self.metrics = metrics
+        self.handled = 0
+        self.failed = 0
+        self._slots = asyncio.Semaphore(WORKER_MAX_CONCURRENCY)
+        self._chains: dict[int, asyncio.Task] = {}
+        self._dp: Dispatcher | None = None
+        self._bot: Bot | None = None
+
+    def snapshot(self) -> dict:
+        """Counters reported to the supervisor."""
+        from game.engine import game_engine
+        from handlers.commands import game_guard
+        return {
+            "worker": self.shard.index,
+            "pid": os.getpid(),
+            "handled": self.handled,
+            "failed": self.failed,
+            "in_flight": len(self._chains),
+            "pending_games": game_engine.pending_count,
+            "user_cache": Database.cache_stats(),
+            "send": send_limiter.stats(),
+            "rejected_game_starts": game_guard.rejected,
+        }
+
+    async def run(self) -> None:
+        """Start the bot's background services for this shard and handle updates until told to stop."""
+        # Imported here: main imports this package to start the supervisor.
+        from main import create_dispatcher
+        self._dp = dp = create_dispatcher()
+        self._bot = Bot(token=getenv("BOT_TOKEN"), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+        send_limiter.set_global_limit(SEND_GLOBAL_RATE / self.shard.count,
+                                      max(1.0, SEND_GLOBAL_BURST / self.shard.count))
+        self._bot.session.middleware(send_limiter)
+        await dp.emit_startup(bot=self._bot, shard=self.shard)
+        logger.info(f"Worker {self.shard.index} started.")
+        reporter = asyncio.create_task(self._report())
+        try:
+            while (update := await asyncio.to_thread(self.updates.get)) is not None:
+                await self._slots.acquire()
+                self._dispatch(update)
+        finally:
+            if self._chains:
+                await asyncio.gather(*self._chains.values(), return_exceptions=True)
+            reporter.cancel()
+            self.metrics.put(self.snapshot())
+            await dp.emit_shutdown(bot=self._bot, shard=self.shard)
+            await self._bot.session.close()
+            logger.info(f"Worker {self.shard.index} stopped after {self.handled} updates.")
+            await logger.complete()
+
+    def _dispatch(self, update: dict) -> None:
+        """Handle an update after the previous update of the same user."""
+        user_id = update_user_id(update)
+        task = asyncio.create_task(self._handle(self._chains.get(user_id), update))
+        self._chains[user_id] = task
+        task.add_done_callback(lambda done: self._finished(user_id, done))
+
+    def _finished(self, user_id: int, task: asyncio.Task) -> None:
+        self._slots.release()
+        if self._chains.get(user_id) is task:
+            del self._chains[user_id]
+
+    async def _handle(self, previous: asyncio.Task | None, update: dict) -> None:
+        """Feed an update to the dispatcher once the user's previous update was handled."""
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await self._dp.feed_raw_update(self._bot, update)
+            self.handled += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Worker {self.shard.index} failed to handle update {update.get('update_id')}: {e}")
+
+    async def _report(self) -> None:
+        """Send a snapshot of the counters to the supervisor periodically."""
+        while True:
+            await asyncio.sleep(WORKER_METRICS_INTERVAL)
+            self.metrics.put(self.snapshot())
+
+
+def run_worker(index: int, count: int, updates: Queue, metrics: Queue) -> None:
+    """Entry point of a worker process. Interrupts and SIGTERM are ignored, also when sent to the whole process
+    group; the supervisor stops workers by queueing None once it has stopped receiving updates."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    setup_logging(f"worker-{index}")
+    asyncio.run(Worker(Shard(index, count), updates, metrics).run())